@@ -8,8 +8,18 @@ from .analyse_tool import *
 from .static_optimization import *
 from .muscle_analysis import *
 from .joint_reaction import *
+from .compression import *
+from .fileio import *
+from .tables import *
 from .analogs import *
 from .markers import *
+from .batch import *
+from .results import *
+from .executor import *
+from .forceplates import *
+from .emg import *
+from .scheduling import *
+from .cohort import *
 
 __author__ = "Romain Martinez"
 __version__ = "0.1.0"
@@ -1,10 +1,17 @@
+from fractions import Fraction
 from pathlib import Path
 
 import numpy as np
 import opensim as osim
+from scipy.interpolate import interp1d
+from scipy.signal import butter, filtfilt, resample_poly
 
 from pyomeca import Analogs
 
+from pyosim.compression import is_compressed, strip_compression, compress_file
+from pyosim.fileio import write_sto, StoFile, time_vector, get_precision
+from pyosim.tables import array_to_table, table_to_array
+
 
 class Analogs3dOsim(Analogs):
     def __new__(cls, *args, **kwargs):
@@ -17,40 +24,198 @@ class Analogs3dOsim(Analogs):
         if obj is None or not isinstance(obj, Analogs3dOsim):
             return
 
-    def to_sto(self, filename, metadata=None):
+    @classmethod
+    def from_sto(cls, filename, names=None, start=None, end=None, dtype=None):
+        """
+        Read a mot/sto file (e.g. output of the pyosim tools) into a Analogs3dOsim.
+        Only the selected columns and time window are decoded.
+
+        Parameters
+        ----------
+        filename : str, Path
+            path of the mot/sto file
+        names : list, optional
+            columns to read (all by default)
+        start : float, optional
+            first time to read (s)
+        end : float, optional
+            last time to read (s)
+        dtype : numpy.dtype, optional
+            dtype of the data, e.g. `np.float32` (project-level
+            policy by default, see `set_precision`)
+
+        Returns
+        -------
+        Analogs3dOsim
+        """
+        sto = StoFile(filename)
+        time, data = sto.read(names=names, start=start, end=end, dtype=dtype)
+        analogs = cls(data[np.newaxis, ...], time_frames=time)
+        if time.size > 1:
+            analogs.get_rate = (time.size - 1) / (time[-1] - time[0])
+        analogs.get_labels = list(names) if names is not None else sto.labels[1:]
+        return analogs
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        Convert an OpenSim TimeSeriesTable into a Analogs3dOsim in one block
+
+        Parameters
+        ----------
+        table : osim.TimeSeriesTable
+            table to convert
+
+        Returns
+        -------
+        Analogs3dOsim
+        """
+        data, time, labels, metadata = table_to_array(table)
+        analogs = cls(data[np.newaxis, ...], time_frames=time)
+        analogs.get_labels = labels
+        if 'DataRate' in metadata:
+            analogs.get_rate = float(metadata['DataRate'])
+        elif time.size > 1:
+            analogs.get_rate = (time.size - 1) / (time[-1] - time[0])
+        return analogs
+
+    def to_table(self, metadata=None):
+        """
+        Convert a Analogs3dOsim into an OpenSim TimeSeriesTable in one block
+
+        Parameters
+        ----------
+        metadata : dict, optional
+            dict with optional metadata to add in the table
+
+        Returns
+        -------
+        osim.TimeSeriesTable
+        """
+        return array_to_table(
+            np.asarray(self).reshape(-1, self.shape[-1]),
+            time_vector(self.shape[-1], self.get_rate),
+            self.get_labels,
+            metadata=metadata
+        )
+
+    def resample(self, rate=None, time=None):
+        """
+        Resample all channels at once, with an anti-aliasing filter, to a
+        target rate or onto a time vector (e.g. the markers time vector)
+
+        Parameters
+        ----------
+        rate : float, optional
+            target rate (Hz), resampled with a polyphase filter
+        time : numpy.ndarray, optional
+            target time vector (s), interpolated after a low
+            pass filter at 80 % of its Nyquist frequency
+
+        Returns
+        -------
+        tuple
+            (resampled Analogs3dOsim, its time vector)
+        """
+        if (rate is None) == (time is None):
+            raise ValueError('specify either rate or time')
+        if not self.get_rate:
+            raise ValueError(
+                'get_rate is empty. Please fill with `your_variable.get_rate = 100.0` for example'
+            )
+
+        data = np.asarray(self).reshape(-1, self.shape[-1])
+        if rate is not None:
+            ratio = Fraction(rate / self.get_rate).limit_denominator(1000)
+            data = resample_poly(data, ratio.numerator, ratio.denominator, axis=-1)
+            time = time_vector(data.shape[-1], rate)
+        else:
+            time = np.asarray(time, dtype=np.float64)
+            rate = (time.size - 1) / (time[-1] - time[0])
+            if rate < self.get_rate:
+                data = filtfilt(*butter(4, 0.8 * rate / self.get_rate), data, axis=-1)
+            data = interp1d(time_vector(self.shape[-1], self.get_rate), data, axis=-1,
+                            assume_sorted=True, bounds_error=False,
+                            fill_value=(data[:, 0], data[:, -1]))(time)
+
+        resampled = Analogs3dOsim(data[np.newaxis, ...], time_frames=time)
+        resampled.get_rate = rate
+        resampled.get_labels = self.get_labels
+        resampled.get_unit = self.get_unit
+        return resampled, time
+
+    def to_sto(self, filename, metadata=None, use_adapter=False, quantity='analogs', digits=None,
+               rate=None, time=None, make_dirs=True):
         """
         Write a sto file from a Analogs3dOsim
         Parameters
         ----------
         filename : string
-            path of the file to write
+            path of the file to write (compressed if it ends with .gz, .bz2, .xz or .zst)
         metadata : dict, optional
             dict with optional metadata to add in the output file
+        use_adapter : bool, optional
+            Write the file with `osim.STOFileAdapter` if True.
+            By default, the whole array is written in one block (much faster)
+        quantity : str, optional
+            quantity type (`analogs`, `forces`, `moments`,
+            `angles`) used to get the project-level precision
+        digits : int, optional
+            significant digits written (project-level precision
+            of `quantity` by default, see `set_precision`).
+            Ignored by the adapter
+        rate : float, optional
+            resample the analogs to this rate before writing (see `resample`)
+        time : numpy.ndarray, optional
+            resample the analogs onto this time vector (e.g.
+            markers time vector) before writing (see `resample`)
+        make_dirs : bool, optional
+            create the directory of `filename` if it does not exist
+            (False to skip the check when the caller already created it, e.g. `batch_export`)
         """
         filename = Path(filename)
-        # Make sure the directory exists, otherwise create it
-        if not filename.parents[0].is_dir():
-            filename.parents[0].mkdir()
-
-        table = osim.TimeSeriesTable()
-
-        # set metadata
-        table.setColumnLabels(self.get_labels)
-        if metadata:
-            for key, value in metadata.items():
-                table.addTableMetaDataString(key, str(value))
-            if 'nColumns' not in metadata:
-                table.addTableMetaDataString('nColumns', str(self.shape[1]))
-        else:
-            table.addTableMetaDataString('nColumns', str(self.shape[1]))
-        table.addTableMetaDataString('nRows', str(self.shape[-1]))
+        if make_dirs:
+            filename.parent.mkdir(parents=True, exist_ok=True)
 
-        time_vector = np.arange(start=0, stop=1 / self.get_rate * self.shape[2], step=1 / self.get_rate)
+        if use_adapter:
+            if rate is not None or time is not None:
+                raise ValueError('resampling is not available with the adapter')
+            self._to_sto_adapter(filename, metadata)
+        else:
+            analogs = self
+            if rate is not None or time is not None:
+                analogs, time = self.resample(rate=rate, time=time)
+            header = {key: str(value) for key, value in metadata.items()} if metadata else {}
+            header.setdefault('nColumns', str(analogs.shape[1]))
+            write_sto(
+                filename,
+                analogs.reshape(-1, analogs.shape[-1]),
+                labels=analogs.get_labels,
+                rate=analogs.get_rate,
+                metadata=header,
+                opensim_version=osim.GetVersion(),
+                digits=digits or get_precision(quantity),
+                time=time
+            )
 
-        for iframe in range(self.shape[-1]):
-            a = self.get_frame(iframe)
-            row = osim.RowVector(a.ravel().tolist())
-            table.appendRow(time_vector[iframe], row)
+    def _to_sto_adapter(self, filename, metadata=None):
+        """
+        Write a sto file from a Analogs3dOsim with `osim.STOFileAdapter`
+        Parameters
+        ----------
+        filename : Path
+            path of the file to write
+        metadata : dict, optional
+            dict with optional metadata to add in the output file
+        """
+        header = dict(metadata) if metadata else {}
+        header.setdefault('nColumns', str(self.shape[1]))
+        header['nRows'] = str(self.shape[-1])
+        table = self.to_table(metadata=header)
 
         adapter = osim.STOFileAdapter()
-        adapter.write(table, str(filename))
+        if is_compressed(filename):
+            adapter.write(table, str(strip_compression(filename)))
+            compress_file(strip_compression(filename), output=filename)
+        else:
+            adapter.write(table, str(filename))
@@ -2,10 +2,26 @@
 Analyze tool class in pyosim.
 Used in static optimization, muscle analysis and joint reaction analysis.
 """
+from functools import partial
 from pathlib import Path
 
 import opensim as osim
 
+from pyosim.compression import (
+    as_plain,
+    strip_compression,
+    find_file,
+    compress_file,
+    remove_scratch,
+    scratch_directory,
+    is_compressed,
+)
+from pyosim.executor import Executor
+from pyosim.fileio import probe_time_range, TimeIndex, get_precision, round_file
+from pyosim.model import get_model
+from pyosim.results import ToolResults, run_trial
+from pyosim.scheduling import CostModel
+
 
 class AnalyzeTool:
     """
@@ -23,11 +39,15 @@ class AnalyzeTool:
     xml_forces : str, optional
         Path to the generic forces sensor xml (Optional)
     ext_forces_dir : str, optional
-        Path of the directory containing the external forces files (`.sto`) (Optional)
+        Path of the directory containing the external forces
+        files (`.sto`, or compressed `.sto.gz`, etc.) (Optional)
     muscle_forces_dir : str, optional
-        Path of the directory containing the muscle forces files (`.sto`) (Optional)
+        Path of the directory containing the muscle forces files
+        (`<trial>_StaticOptimization_force.sto`, plain or compressed),
+        read by the joint reaction of each trial (Optional)
     mot_files : str, Path, list
-        Path or list of path to the directory containing the motion files (`.mot`)
+        Path or list of path to the directory containing the
+        motion files (`.mot`, or compressed `.mot.gz`, etc.)
     sto_output : Path, str
         Output directory
     xml_actuators: Path, str
@@ -37,9 +57,32 @@ class AnalyzeTool:
     low_pass : int, optional
         Cutoff frequency for an optional low pass filter on coordinates (Optional)
     remove_empty_files : bool, optional
-        remove empty files i in `sto_output` if True (Optional)
+        remove the empty outputs of each trial in `sto_output` if True (Optional)
     multi : bool, optional
         Launch AnalyzeTool in multiprocessing if True
+    index : bool, optional
+        Write a time index next to each output file for random access (see `TimeIndex`) if True
+    compression : str, optional
+        Compress each output file with this suffix (e.g.
+        '.gz') once written (no time index is written then)
+    scratch_dir : str, optional
+        Directory where the compressed inputs and the temporary xml files are written for
+        OpenSim, each trial in its own sub-directory (system temporary directory by default)
+    digits : int, optional
+        Significant digits written in the output files (project-level `forces` precision by default,
+        resolved when the tool is created, see `set_precision`)
+    executor : Executor, optional
+        Persistent executor running the trials (shared with other tools, `multi` is ignored then)
+    cost_model : CostModel, optional
+        Run time estimates used to start the longest trials first with `multi` or
+        `executor`, updated with the run times of the trials (e.g.
+        `CostModel(history=PROJECT_PATH / '_run_times.json')`, no history by default)
+    run : bool, optional
+        Process the trials at initialization if True
+        (otherwise, call `main_loop` or the per-trial method)
+    raise_errors : bool, optional
+        Raise the error of a failing trial if True (otherwise,
+        it is stored in `results` and the other trials go on)
 
     Examples
     --------
@@ -91,6 +134,14 @@ class AnalyzeTool:
         multi=False,
         contains=None,
         print_to_xml=False,
+        index=False,
+        compression=None,
+        scratch_dir=None,
+        digits=None,
+        executor=None,
+        cost_model=None,
+        run=True,
+        raise_errors=True,
     ):
         self.model_input = model_input
         self.xml_input = xml_input
@@ -105,8 +156,15 @@ class AnalyzeTool:
         self.low_pass = low_pass
         self.remove_empty_files = remove_empty_files
         self.multi = multi
+        self.executor = executor
+        self.cost_model = cost_model or CostModel()
+        self.raise_errors = raise_errors
         self.contains = contains
         self.print_to_xml = print_to_xml
+        self.index = index
+        self.compression = compression
+        self.scratch_dir = scratch_dir
+        self.digits = digits or get_precision("forces")
 
         if not isinstance(mot_files, list):
             self.mot_files = [mot_files]
@@ -116,151 +174,235 @@ class AnalyzeTool:
         if not isinstance(self.mot_files[0], Path):
             self.mot_files = [Path(i) for i in self.mot_files]
 
-        self.main_loop()
+        if run:
+            self.main_loop()
 
     def main_loop(self):
-        if self.multi:
-            import os
-            from multiprocessing import Pool
-
-            pool = Pool(os.cpu_count())
-            pool.map(self.run_analyze_tool, self.mot_files)
+        run = partial(run_trial, self.run_analyze_tool, raise_errors=self.raise_errors)
+        stage = self.__class__.__name__
+        if self.executor or self.multi:
+            # longest trials first, so that a long trial does not end up alone at the end
+            files = self.cost_model.longest_first(self.mot_files, stage, model=self.model_input)
+        if self.executor:
+            trials = self.executor.map(run, files)
+        elif self.multi:
+            with Executor() as executor:
+                trials = executor.map(run, files)
         else:
-            for itrial in self.mot_files:
-                self.run_analyze_tool(itrial)
+            trials = [run(itrial) for itrial in self.mot_files]
+        self.cost_model.record_results(trials, stage, model=self.model_input)
+        self.cost_model.save()
+        self.results = ToolResults(stage, trials)
+        return self.results
+
+    def run_analyze_tool(self, trial, forces_file=None):
+        """
+        Run the analysis on one trial
 
-    def run_analyze_tool(self, trial):
-        if self.prefix and not trial.stem.startswith(self.prefix):
+        Parameters
+        ----------
+        trial : Path
+            Motion file
+        forces_file : str, Path, optional
+            Muscle forces of this trial for the joint reaction
+            (e.g. the static optimization output of the trial).
+            By default, the file of the trial in
+            `muscle_forces_dir`, else `forces_file` of the instance
+
+        Returns
+        -------
+        list
+            Output files (None if the trial is skipped)
+        """
+        if self.prefix and not strip_compression(trial).stem.startswith(self.prefix):
             # skip file if user specified a prefix and prefix is not present in current file
             pass
         else:
-            print(f"\t{trial.stem}")
-
-            # model
-            model = osim.Model(self.model_input) if isinstance(self.model_input, str) is True else self.model_input
-            model.initSystem()
-
-            # get starting and ending time
-            motion = osim.Storage(f"{trial.resolve()}")
-            first_time = motion.getFirstTime()
-            last_time = motion.getLastTime()
+            # OpenSim needs plain files
+            # (removed with the temporary xml once the trial is processed, even if it fails)
+            scratch_files = []
+            motion_file = self._as_plain(trial, scratch_files)
+            trial = strip_compression(trial)
+            try:
+                print(f"\t{trial.stem}")
 
-            # prepare external forces xml file
-            if self.xml_forces:
-                external_loads = osim.ExternalLoads(self.xml_forces, True)
-                if self.prefix:
-                    external_loads.setDataFileName(
-                        f"{Path(self.ext_forces_dir, trial.stem.replace(f'{self.prefix}_', '')).resolve()}.sto"
-                    )
+                # model
+                # a copy of the cached model, as the analysis and the actuators are added to it
+                # (its system is initialized once by the analyze tool, after these additions)
+                if isinstance(self.model_input, str) is True:
+                    model = get_model(self.model_input, copy=True)
                 else:
+                    model = self.model_input
+
+                # get starting and ending time
+                first_time, last_time = probe_time_range(motion_file)
+
+                # prepare external forces xml file
+                if self.xml_forces:
+                    external_loads = osim.ExternalLoads(self.xml_forces, True)
+                    if self.prefix:
+                        loads_stem = trial.stem.replace(f"{self.prefix}_", "")
+                    else:
+                        loads_stem = trial.stem
+                    loads_file = find_file(Path(self.ext_forces_dir, f"{loads_stem}.sto"))
                     external_loads.setDataFileName(
-                        f"{Path(self.ext_forces_dir, trial.stem).resolve()}.sto"
+                        f"{self._as_plain(loads_file, scratch_files).resolve()}"
                     )
-                external_loads.setExternalLoadsModelKinematicsFileName(
-                    f"{trial.resolve()}"
-                )
-                if self.low_pass:
-                    external_loads.setLowpassCutoffFrequencyForLoadKinematics(
-                        self.low_pass
+                    external_loads.setExternalLoadsModelKinematicsFileName(
+                        f"{motion_file.resolve()}"
                     )
-                temp_xml = Path(f"{trial.stem}_temp.xml")
-                external_loads.printToXML(f"{temp_xml.resolve()}")  # temporary xml file
-
-            current_class = self.get_class_name()
-            params = self.parse_analyze_set_xml(self.xml_input, node=current_class)
-            solve_for_equilibrium = False
-            if current_class == "StaticOptimization":
-                analysis = osim.StaticOptimization(model)
-                analysis.setUseModelForceSet(params["use_model_force_set"])
-                analysis.setActivationExponent(params["activation_exponent"])
-                analysis.setUseMusclePhysiology(params["use_muscle_physiology"])
-                analysis.setConvergenceCriterion(
-                    params["optimizer_convergence_criterion"]
-                )
-                analysis.setMaxIterations(int(params["optimizer_max_iterations"]))
-            elif current_class == "MuscleAnalysis":
-                solve_for_equilibrium = True
-                analysis = osim.MuscleAnalysis(model)
-                coord = osim.ArrayStr()
-                for c in params["moment_arm_coordinate_list"]:
-                    coord.append(c)
-                analysis.setCoordinates(coord)
-
-                mus = osim.ArrayStr()
-                for m in params["muscle_list"]:
-                    mus.append(m)
-                analysis.setMuscles(mus)
-                # analysis.setComputeMoments(params["compute_moments"])
-            elif current_class == "JointReaction":
-                # construct joint reaction analysis
-                analysis = osim.JointReaction(model)
-                if params["forces_file"] or self.forces_file:
-                    force_file = self.forces_file if self.forces_file else params["forces_file"]
-                    analysis.setForcesFileName(force_file)
-
-                joint = osim.ArrayStr()
-                for j in params["joint_names"]:
-                    joint.append(j)
-                analysis.setJointNames(joint)
-
-                body = osim.ArrayStr()
-                for b in params["apply_on_bodies"]:
-                    body.append(b)
-                analysis.setOnBody(body)
-
-                frame = osim.ArrayStr()
-                for f in params["express_in_frame"]:
-                    frame.append(f)
-                analysis.setInFrame(frame)
-            else:
-                raise ValueError("AnalyzeTool must be called from a child class")
-            analysis.setModel(model)
-            analysis.setName(current_class)
-            analysis.setOn(params["on"])
-            analysis.setStepInterval(int(params["step_interval"]))
-            analysis.setInDegrees(params["in_degrees"])
-            analysis.setStartTime(first_time)
-            analysis.setEndTime(last_time)
-            model.addAnalysis(analysis)
-
-            if self.print_to_xml is True:
-                analysis.printToXML(f"{self.xml_output}/{current_class}_analysis.xml")
-
-            # analysis tool
-            analyze_tool = osim.AnalyzeTool(model)
-            analyze_tool.setName(trial.stem)
-            analyze_tool.setModel(model)
-            analyze_tool.setModelFilename(Path(model.toString()).stem)
-            analyze_tool.setSolveForEquilibrium(solve_for_equilibrium)
-
-            if self.xml_actuators:
-                force_set = osim.ArrayStr()
-                force_set.append(self.xml_actuators)
-                analyze_tool.setForceSetFiles(force_set)
-                analyze_tool.updateModelForces(model, self.xml_actuators)
-
-            analyze_tool.setInitialTime(first_time)
-            analyze_tool.setFinalTime(last_time)
-
-            if self.low_pass:
-                analyze_tool.setLowpassCutoffFrequency(self.low_pass)
-
-            analyze_tool.setCoordinatesFileName(f"{trial.resolve()}")
-            if self.xml_forces:
-                analyze_tool.setExternalLoadsFileName(f"{temp_xml}")
-            analyze_tool.setLoadModelAndInput(True)
-            analyze_tool.setResultsDir(f"{self.sto_output}")
-
-            analyze_tool.run()
-
-            if self.xml_forces:
-                temp_xml.unlink()  # delete temporary xml file
+                    if self.low_pass:
+                        external_loads.setLowpassCutoffFrequencyForLoadKinematics(
+                            self.low_pass
+                        )
+                    # temporary xml file, in a directory of its own as trials run concurrently
+                    temp_xml = (
+                        scratch_directory(self.scratch_dir) / f"{trial.stem}_external_loads.xml"
+                    )
+                    external_loads.printToXML(f"{temp_xml}")
+                    scratch_files.append(temp_xml)
+
+                current_class = self.get_class_name()
+                params = self.parse_analyze_set_xml(self.xml_input, node=current_class)
+                solve_for_equilibrium = False
+                if current_class == "StaticOptimization":
+                    analysis = osim.StaticOptimization(model)
+                    analysis.setUseModelForceSet(params["use_model_force_set"])
+                    analysis.setActivationExponent(params["activation_exponent"])
+                    analysis.setUseMusclePhysiology(params["use_muscle_physiology"])
+                    analysis.setConvergenceCriterion(
+                        params["optimizer_convergence_criterion"]
+                    )
+                    analysis.setMaxIterations(int(params["optimizer_max_iterations"]))
+                elif current_class == "MuscleAnalysis":
+                    solve_for_equilibrium = True
+                    analysis = osim.MuscleAnalysis(model)
+                    coord = osim.ArrayStr()
+                    for c in params["moment_arm_coordinate_list"]:
+                        coord.append(c)
+                    analysis.setCoordinates(coord)
+
+                    mus = osim.ArrayStr()
+                    for m in params["muscle_list"]:
+                        mus.append(m)
+                    analysis.setMuscles(mus)
+                    # analysis.setComputeMoments(params["compute_moments"])
+                elif current_class == "JointReaction":
+                    # construct joint reaction analysis
+                    analysis = osim.JointReaction(model)
+                    # muscle forces of this trial first, then the ones shared by all the trials
+                    if not forces_file and self.muscle_forces_dir:
+                        forces_file = find_file(
+                            Path(
+                                self.muscle_forces_dir,
+                                f"{trial.stem}_StaticOptimization_force.sto",
+                            )
+                        )
+                    forces_file = forces_file or self.forces_file
+                    if params["forces_file"] or forces_file:
+                        if forces_file:
+                            force_file = f"{self._as_plain(forces_file, scratch_files)}"
+                        else:
+                            force_file = params["forces_file"]
+                        analysis.setForcesFileName(force_file)
+
+                    joint = osim.ArrayStr()
+                    for j in params["joint_names"]:
+                        joint.append(j)
+                    analysis.setJointNames(joint)
+
+                    body = osim.ArrayStr()
+                    for b in params["apply_on_bodies"]:
+                        body.append(b)
+                    analysis.setOnBody(body)
+
+                    frame = osim.ArrayStr()
+                    for f in params["express_in_frame"]:
+                        frame.append(f)
+                    analysis.setInFrame(frame)
+                else:
+                    raise ValueError("AnalyzeTool must be called from a child class")
+                analysis.setModel(model)
+                analysis.setName(current_class)
+                analysis.setOn(params["on"])
+                analysis.setStepInterval(int(params["step_interval"]))
+                analysis.setInDegrees(params["in_degrees"])
+                analysis.setStartTime(first_time)
+                analysis.setEndTime(last_time)
+                model.addAnalysis(analysis)
+
+                if self.print_to_xml is True:
+                    analysis.printToXML(f"{self.xml_output}/{current_class}_analysis.xml")
+
+                # analysis tool
+                analyze_tool = osim.AnalyzeTool(model)
+                analyze_tool.setName(trial.stem)
+                analyze_tool.setModel(model)
+                analyze_tool.setModelFilename(Path(model.toString()).stem)
+                analyze_tool.setSolveForEquilibrium(solve_for_equilibrium)
+
+                if self.xml_actuators:
+                    force_set = osim.ArrayStr()
+                    force_set.append(self.xml_actuators)
+                    analyze_tool.setForceSetFiles(force_set)
+                    analyze_tool.updateModelForces(model, self.xml_actuators)
+
+                analyze_tool.setInitialTime(first_time)
+                analyze_tool.setFinalTime(last_time)
 
+                if self.low_pass:
+                    analyze_tool.setLowpassCutoffFrequency(self.low_pass)
+
+                analyze_tool.setCoordinatesFileName(f"{motion_file.resolve()}")
+                if self.xml_forces:
+                    analyze_tool.setExternalLoadsFileName(f"{temp_xml}")
+                # OpenSim loads the model and its inputs
+                # (coordinates, external loads) again at `run`:
+                # the model cache only spares the parsing of the osim file for the clone above
+                analyze_tool.setLoadModelAndInput(True)
+                analyze_tool.setResultsDir(f"{self.sto_output}")
+
+                analyze_tool.run()
+            finally:
+                for ifile in scratch_files:
+                    remove_scratch(ifile)
+
+            # only the outputs of this trial are touched, as
+            # other trials may be running in `sto_output`
+            files = sorted(Path(self.sto_output).glob(f"{trial.stem}_{current_class}_*.sto"))
             if self.remove_empty_files:
-                self._remove_empty_files(directory=self.sto_output)
+                files = self._remove_empty_files(files)
 
             if self.contains:
-                self._subset_output(directory=self.sto_output, contains=self.contains)
+                files = self._subset_output(files, contains=self.contains)
+
+            outputs = []
+            for ifile in files:
+                # OpenSim's output precision is a number of decimals, not of significant digits
+                if self.digits:
+                    round_file(ifile, self.digits)
+                if self.compression:
+                    ifile = compress_file(ifile, compression=self.compression)
+                elif self.index:
+                    TimeIndex.build(ifile).save()
+                outputs.append(ifile)
+            return outputs
+
+    def _as_plain(self, filename, scratch_files):
+        """
+        Get a plain version of a (possibly compressed) file for OpenSim
+
+        Parameters
+        ----------
+        filename : str, Path
+            file
+        scratch_files : list
+            list of the decompressed files to remove once the trial is processed, updated in place
+        """
+        plain = as_plain(filename, self.scratch_dir)
+        if plain != Path(filename):
+            scratch_files.append(plain)
+        return plain
 
     def parse_analyze_set_xml(self, filename, node):
         from xml.etree import ElementTree
@@ -304,36 +446,56 @@ class AnalyzeTool:
         return li
 
     @staticmethod
-    def _remove_empty_files(directory, threshold=1000):
+    def _remove_empty_files(files, threshold=1000):
         """
-        Remove empty files from a directory.
+        Remove empty files among the outputs of a trial (compressed files are kept).
 
         Parameters
         ----------
-        directory : str, Path
-            directory
+        files : list
+            output files
         threshold : int
             threshold in bytes
+
+        Returns
+        -------
+        list
+            remaining files
         """
-        for ifile in Path(directory).iterdir():
-            if ifile.stat().st_size < threshold:
-                ifile.unlink()
+        kept = []
+        for ifile in files:
+            if is_compressed(ifile) or ifile.stat().st_size >= threshold:
+                kept.append(ifile)
+                continue
+            ifile.unlink()
+            if TimeIndex.sidecar(ifile).is_file():
+                TimeIndex.sidecar(ifile).unlink()
+        return kept
 
     @staticmethod
-    def _subset_output(directory, contains):
+    def _subset_output(files, contains):
         """
-        Keep only files that contains `contains` string
+        Keep only the outputs of a trial that contains `contains` string
 
         Parameters
         ----------
-        directory : str, Path
-            directory
+        files : list
+            output files
         contains : str
             string
+
+        Returns
+        -------
+        list
+            remaining files
         """
-        for ifile in Path(directory).iterdir():
-            if contains not in ifile.stem:
+        kept = []
+        for ifile in files:
+            if contains in ifile.stem:
+                kept.append(ifile)
+            else:
                 ifile.unlink()
+        return kept
 
     @classmethod
     def get_class_name(cls):
@@ -0,0 +1,314 @@
+"""
+Batch export in pyosim
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pyosim.analogs import Analogs3dOsim
+from pyosim.compression import open_file
+from pyosim.fileio import read_trc_header, read_trc, write_trc, get_precision
+from pyosim.markers import Markers3dOsim
+from pyosim.model import get_marker_names
+
+
+def _to_payload(data):
+    """
+    Split a Markers3dOsim/Analogs3dOsim into picklable parts (pickle loses the metadata attributes)
+    """
+    if not isinstance(data, (Markers3dOsim, Analogs3dOsim)):
+        raise ValueError(
+            f'{type(data).__name__} cannot be exported. Use Markers3dOsim or Analogs3dOsim'
+        )
+    return type(data), np.asarray(data), {
+        'get_rate': data.get_rate,
+        'get_unit': data.get_unit,
+        'get_labels': data.get_labels,
+    }
+
+
+def _export(filename, payload, kwargs):
+    """Export one file and return its timing and size"""
+    cls, array, attributes = payload
+    data = cls(array)
+    for key, value in attributes.items():
+        setattr(data, key, value)
+
+    tic = time.perf_counter()
+    if cls is Markers3dOsim:
+        data.to_trc(filename, **kwargs.get('trc', {}))
+    else:
+        data.to_sto(filename, **kwargs.get('sto', {}))
+    return {
+        'file': f'{filename}',
+        'seconds': time.perf_counter() - tic,
+        'bytes': Path(filename).stat().st_size,
+    }
+
+
+def batch_export(files, workers=None, use_processes=False, trc_kwargs=None, sto_kwargs=None):
+    """
+    Write many Markers3dOsim/Analogs3dOsim concurrently (`to_trc` for markers, `to_sto` for analogs)
+
+    Parameters
+    ----------
+    files : dict
+        Dictionary with the output paths as keys and Markers3dOsim/Analogs3dOsim as values
+    workers : int, optional
+        Maximum number of concurrent exports (number of cpu by default)
+    use_processes : bool, optional
+        Use a process pool instead of a thread pool if True
+        (threads overlap the disk/network I/O, processes also parallelize the formatting)
+    trc_kwargs : dict, optional
+        Keyword arguments passed to `Markers3dOsim.to_trc`
+    sto_kwargs : dict, optional
+        Keyword arguments passed to `Analogs3dOsim.to_sto`
+
+    Returns
+    -------
+    pandas.DataFrame
+        Per-file timing (`seconds`) and size (`bytes`)
+
+    Examples
+    --------
+    >>> from pathlib import Path
+    >>> from pyosim import Markers3dOsim, batch_export
+    >>>
+    >>> PROJECT_PATH = Path('../Misc/project_sample')
+    >>> participant = 'dapo'
+    >>> trials = {...}  # {trial name: Markers3dOsim}
+    >>>
+    >>> report = batch_export(
+    >>>     {
+    >>>         PROJECT_PATH / participant / '0_markers' / f'{name}.trc': markers
+    >>>         for name, markers in trials.items()
+    >>>     }
+    >>> )
+    >>> print(report['seconds'].sum(), report['bytes'].sum())
+    """
+    files = {Path(filename): data for filename, data in files.items()}
+    # the directories are created once, up front, not by each writer
+    kwargs = {
+        'trc': {'make_dirs': False, **(trc_kwargs or {})},
+        'sto': {'make_dirs': False, **(sto_kwargs or {})},
+    }
+
+    for directory in {filename.parent for filename in files}:
+        directory.mkdir(parents=True, exist_ok=True)
+
+    executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [
+            pool.submit(_export, filename, _to_payload(data), kwargs)
+            for filename, data in files.items()
+        ]
+        report = [future.result() for future in futures]
+    return pd.DataFrame(report, columns=['file', 'seconds', 'bytes'])
+
+
+def _ingest(c3d_file, participant_path, markers, analogs, suffix, kwargs):
+    """Convert one c3d file into the participant directories and return its size and timing"""
+    tic = time.perf_counter()
+    outputs, n_frames = [], 0
+    if markers is not None:
+        data = Markers3dOsim.from_c3d(f'{c3d_file}', names=markers or None)
+        trc_file = participant_path / '0_markers' / f'{c3d_file.stem}.trc{suffix}'
+        data.to_trc(trc_file, **kwargs.get('trc', {}))
+        outputs.append(trc_file)
+        n_frames = data.shape[-1]
+    if analogs:
+        # the c3d is parsed once, with the channels of all the
+        # directories (all of them if one directory wants all)
+        if all(analogs.values()):
+            names = list(dict.fromkeys(
+                channel for channels in analogs.values() for channel in channels
+            ))
+        else:
+            names = None
+        data = Analogs3dOsim.from_c3d(f'{c3d_file}', names=names)
+        labels = list(data.get_labels)
+    for directory, channels in analogs.items():
+        missing = [channel for channel in channels if channel not in labels]
+        if missing:
+            raise ValueError(f'channels {missing} are not in {c3d_file}')
+        subset = Analogs3dOsim(
+            np.asarray(data)[:, [labels.index(channel) for channel in channels or labels], :],
+            time_frames=data.get_time_frames
+        )
+        subset.get_rate = data.get_rate
+        subset.get_labels = list(channels) or labels
+        subset.get_unit = data.get_unit
+        sto_file = participant_path / directory / f'{c3d_file.stem}.sto{suffix}'
+        subset.to_sto(sto_file, **kwargs.get('sto', {}))
+        outputs.append(sto_file)
+    return {
+        'file': f'{c3d_file}',
+        'frames': n_frames,
+        'seconds': time.perf_counter() - tic,
+        'bytes': c3d_file.stat().st_size,
+        'outputs': [f'{ifile}' for ifile in outputs],
+    }
+
+
+def batch_ingest_c3d(c3d_files, participant_path, markers=None, analogs=None, workers=None,
+                     compression=None, trc_kwargs=None, sto_kwargs=None):
+    """
+    Convert c3d files into the trc/sto files of a participant, in a process pool.
+    Only the selected markers and analog channels are extracted.
+
+    Parameters
+    ----------
+    c3d_files : list
+        Paths of the c3d files
+    participant_path : str, Path
+        Participant directory, as created by `Project.update_participants`
+    markers : list, optional
+        Markers written in `0_markers` (all if empty, no trc written if None)
+    analogs : dict, optional
+        Analog channels per participant directory (e.g.
+        `{'0_forces': [...], '0_emg': [...]}`, all if empty)
+    workers : int, optional
+        Number of processes (number of cpu by default)
+    compression : str, optional
+        Compress the output files with this suffix (e.g. '.gz')
+    trc_kwargs : dict, optional
+        Keyword arguments passed to `Markers3dOsim.to_trc`
+    sto_kwargs : dict, optional
+        Keyword arguments passed to `Analogs3dOsim.to_sto`
+
+    Returns
+    -------
+    pandas.DataFrame
+        Per-file frames, timing (`seconds`), c3d size (`bytes`) and `outputs`
+
+    Examples
+    --------
+    >>> from pathlib import Path
+    >>> from pyosim import batch_ingest_c3d
+    >>>
+    >>> PROJECT_PATH = Path('../Misc/project_sample')
+    >>> participant = 'dapo'
+    >>>
+    >>> report = batch_ingest_c3d(
+    >>>     sorted(Path('/media/data/dapo').glob('*.c3d')),
+    >>>     PROJECT_PATH / participant,
+    >>>     markers=['STER', 'XIPH', 'C7', 'T10'],
+    >>>     analogs={
+    >>>         '0_forces': ['Voltage.1', 'Voltage.2', 'Voltage.3'],
+    >>>         '0_emg': ['Voltage.13', 'Voltage.14'],
+    >>>     }
+    >>> )
+    """
+    participant_path = Path(participant_path)
+    analogs = analogs or {}
+    suffix = compression or ''
+    # the directories are created once, up front, not by each writer
+    kwargs = {
+        'trc': {'make_dirs': False, **(trc_kwargs or {})},
+        'sto': {'make_dirs': False, **(sto_kwargs or {})},
+    }
+
+    for directory in (['0_markers'] if markers is not None else []) + list(analogs):
+        (participant_path / directory).mkdir(parents=True, exist_ok=True)
+
+    tic = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [
+            pool.submit(_ingest, Path(ifile), participant_path, markers, analogs, suffix, kwargs)
+            for ifile in c3d_files
+        ]
+        report = pd.DataFrame(
+            [future.result() for future in futures],
+            columns=['file', 'frames', 'seconds', 'bytes', 'outputs'],
+        )
+    elapsed = time.perf_counter() - tic
+
+    print(
+        f'{report.shape[0]} c3d files ingested in {elapsed:.1f} s '
+        f'({report.shape[0] / elapsed:.1f} files/s, '
+        f'{report["bytes"].sum() / 1e6 / elapsed:.1f} MB/s)'
+    )
+    return report
+
+
+def _prune(filename, output, names, digits):
+    """
+    Keep only the `names` markers of a trc file and return the kept, removed and missing markers
+    """
+    with open_file(filename, 'rb') as file:
+        labels = read_trc_header(file)['labels']
+    kept = [label for label in labels if label in names]
+    # the values are parsed exactly and written back without rounding to decimals
+    data, time, header = read_trc(filename, names=kept, exact=True)
+    write_trc(output, data, kept, header['rate'], header['unit'], decimals=None,
+              digits=digits or get_precision('markers'), time=time, frames=header['frames'])
+    return {
+        'file': f'{output}',
+        'kept': len(kept),
+        'removed': len(labels) - len(kept),
+        'missing': sorted(names.difference(labels)),
+    }
+
+
+def batch_prune_trc(trc_files, marker_set, output_dir=None, workers=None, use_processes=False,
+                    digits=None):
+    """
+    Keep only the markers used by a model in many trc files, concurrently
+
+    Parameters
+    ----------
+    trc_files : list
+        Paths of the trc files
+    marker_set : str, Path, list
+        Path of the osim model or list of markers names
+    output_dir : str, Path, optional
+        Output directory (the files are overwritten by default)
+    workers : int, optional
+        Maximum number of concurrent files (number of cpu by default)
+    use_processes : bool, optional
+        Use a process pool instead of a thread pool if True
+    digits : int, optional
+        Significant digits written (project-level `markers` precision by default)
+
+    Returns
+    -------
+    pandas.DataFrame
+        Per-file number of `kept` and `removed` markers,
+        and the model markers `missing` from the file
+
+    Examples
+    --------
+    >>> from pathlib import Path
+    >>> from pyosim import batch_prune_trc
+    >>>
+    >>> PROJECT_PATH = Path('../Misc/project_sample')
+    >>> participant = 'dapo'
+    >>>
+    >>> report = batch_prune_trc(
+    >>>     list((PROJECT_PATH / participant / '0_markers').glob('*.trc')),
+    >>>     PROJECT_PATH / participant / '_models' / 'wu_scaled_markers.osim'
+    >>> )
+    >>> print(report[report['missing'].map(len) > 0])
+    """
+    names = set(get_marker_names(marker_set))
+    if output_dir:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [
+            pool.submit(
+                _prune,
+                Path(ifile),
+                Path(output_dir) / Path(ifile).name if output_dir else Path(ifile),
+                names,
+                digits,
+            )
+            for ifile in trc_files
+        ]
+        report = [future.result() for future in futures]
+    return pd.DataFrame(report, columns=['file', 'kept', 'removed', 'missing'])
@@ -0,0 +1,444 @@
+"""
+Cohort-wide batch runners in pyosim.
+Every (participant, trial, stage) of the participants to process is fed to a single worker pool,
+stage by stage (`CohortRunner`) or as soon as the inputs of a trial exist (`PipelineRunner`).
+"""
+from concurrent.futures import as_completed, wait, FIRST_COMPLETED
+from functools import partial
+
+import pandas as pd
+
+from pyosim.compression import strip_compression
+from pyosim.executor import Executor
+from pyosim.inverse_dynamics import InverseDynamics
+from pyosim.inverse_kinematics import InverseKinematics
+from pyosim.joint_reaction import JointReaction
+from pyosim.muscle_analysis import MuscleAnalysis
+from pyosim.results import ToolResults, TrialResult, run_trial
+from pyosim.scheduling import CostModel
+from pyosim.static_optimization import StaticOptimization
+
+# per tool: input directory, input suffix, input argument, output directory, output argument and
+# per-trial method, following the participant layout created by `Project.update_participants`
+LAYOUT = {
+    InverseKinematics: (
+        '0_markers', '.trc', 'trc_files',
+        '1_inverse_kinematic', 'mot_output', 'run_ik_tool',
+    ),
+    InverseDynamics: (
+        '1_inverse_kinematic', '.mot', 'mot_files',
+        '2_inverse_dynamic', 'sto_output', 'run_id_tool',
+    ),
+    StaticOptimization: (
+        '1_inverse_kinematic', '.mot', 'mot_files',
+        '3_static_optimization', 'sto_output', 'run_analyze_tool',
+    ),
+    MuscleAnalysis: (
+        '1_inverse_kinematic', '.mot', 'mot_files',
+        '4_muscle_analysis', 'sto_output', 'run_analyze_tool',
+    ),
+    JointReaction: (
+        '1_inverse_kinematic', '.mot', 'mot_files',
+        '5_joint_reaction_force', 'sto_output', 'run_analyze_tool',
+    ),
+}
+
+# stages needed by each tool, for the same trial
+DEPENDENCIES = {
+    InverseKinematics: [],
+    InverseDynamics: [InverseKinematics],
+    StaticOptimization: [InverseKinematics],
+    MuscleAnalysis: [InverseKinematics],
+    JointReaction: [StaticOptimization],
+}
+
+# per (stage, dependent stage): output of the trial in the stage passed to the per-trial method
+# of the dependent stage, as (keyword argument, string contained in the output filename)
+FORWARDED_OUTPUTS = {
+    (StaticOptimization, JointReaction): ('forces_file', 'StaticOptimization_force'),
+}
+
+# columns of the runners report
+REPORT_COLUMNS = [
+    'participant', 'stage', 'trial', 'status', 'seconds', 'cache_hits', 'cache_misses'
+]
+
+
+class CohortRunner:
+    """
+    Run tools on all the participants to process, with one global task list per stage
+    fed to a single worker pool (no core waits for the last trials of a participant)
+
+    Parameters
+    ----------
+    conf : Conf
+        Project configuration
+    stages : list
+        Ordered list of (tool class, function returning
+        the tool keyword arguments of a participant).
+        The function is called with the participant and the conf. The
+        inputs and output directory are set from the participant layout
+    executor : Executor, optional
+        Persistent executor (a new one, shut down at the end of `run`, by default)
+    participants : list, optional
+        Participants to process (`conf.get_participants_to_process()` by default)
+    cost_model : CostModel, optional
+        Run time estimates used to start the longest trials first
+        (history kept in the project `_run_times.json` by default)
+
+    Examples
+    --------
+    >>> from pathlib import Path
+    >>>
+    >>> from pyosim import Conf, CohortRunner, InverseKinematics, InverseDynamics
+    >>>
+    >>> PROJECT_PATH = Path('../Misc/project_sample')
+    >>> TEMPLATES_PATH = PROJECT_PATH / '_templates'
+    >>> model = 'wu'
+    >>> conf = Conf(project_path=PROJECT_PATH)
+    >>>
+    >>> def ik_kwargs(participant, conf):
+    >>>     participant_path = PROJECT_PATH / participant
+    >>>     return {
+    >>>         'model_input': f"{participant_path / '_models' / model}_scaled_markers.osim",
+    >>>         'xml_input': f'{TEMPLATES_PATH / model}_ik.xml',
+    >>>         'xml_output': f"{participant_path / '_xml' / model}_ik.xml",
+    >>>         'onsets': conf.get_conf_field(participant, ['onset']),
+    >>>         'prefix': model,
+    >>>     }
+    >>>
+    >>> def id_kwargs(participant, conf):
+    >>>     return {...}
+    >>>
+    >>> runner = CohortRunner(
+    >>>     conf, stages=[(InverseKinematics, ik_kwargs), (InverseDynamics, id_kwargs)]
+    >>> )
+    >>> report = runner.run()
+    >>> print(report.groupby(['participant', 'stage'])['status'].value_counts())
+    """
+
+    def __init__(self, conf, stages, executor=None, participants=None, cost_model=None):
+        self.conf = conf
+        self.stages = stages
+        self.executor = executor
+        self.participants = participants or conf.get_participants_to_process()
+        self.cost_model = cost_model or CostModel(
+            history=self.conf.project_path / '_run_times.json'
+        )
+        self.results = {}
+        self._models = {}
+
+    def participant_path(self, participant):
+        """Directory of a participant"""
+        return self.conf.project_path / participant
+
+    def trials(self, tool, participant):
+        """
+        Input files of a tool for a participant (plain or compressed)
+
+        Parameters
+        ----------
+        tool : type
+            Tool class (one of `LAYOUT`)
+        participant : str
+            Participant
+
+        Returns
+        -------
+        list
+        """
+        input_dir, suffix = LAYOUT[tool][:2]
+        directory = self.participant_path(participant) / input_dir
+        if not directory.is_dir():
+            return []
+        return sorted(
+            ifile for ifile in directory.iterdir() if strip_compression(ifile).suffix == suffix
+        )
+
+    def tasks(self, tool, kwargs):
+        """
+        Expand a stage into its (participant, trial, function) tasks
+
+        Parameters
+        ----------
+        tool : type
+            Tool class (one of `LAYOUT`)
+        kwargs : callable
+            Function returning the tool keyword arguments of a participant
+
+        Returns
+        -------
+        list
+        """
+        tasks = []
+        for participant in self.participants:
+            trials = self.trials(tool, participant)
+            if trials:
+                function = self._function(tool, kwargs, participant, trials)
+                tasks.extend((participant, trial, function) for trial in trials)
+        return tasks
+
+    def _function(self, tool, kwargs, participant, trials):
+        """Per-trial function of a tool instance set up (but not run) for a participant"""
+        if tool not in LAYOUT:
+            raise ValueError(f'{tool.__name__} is not one of {[i.__name__ for i in LAYOUT]}')
+        _, _, inputs_key, output_dir, output_key, method = LAYOUT[tool]
+        tool_kwargs = kwargs(participant, self.conf)
+        self._models[(participant, tool)] = tool_kwargs.get('model_input')
+        instance = tool(
+            **tool_kwargs,
+            **{
+                inputs_key: trials,
+                output_key: f'{self.participant_path(participant) / output_dir}',
+            },
+            run=False,
+        )
+        return partial(run_trial, getattr(instance, method))
+
+    def run(self):
+        """
+        Run all the stages, in order
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per task with the `REPORT_COLUMNS` columns
+            (model cache hits and misses during the trial included)
+            (the ToolResults per participant and stage are in `self.results`)
+        """
+        executor = self.executor or Executor()
+        executor.start()
+        report = []
+        try:
+            for tool, kwargs in self.stages:
+                report.extend(self._run_stage(executor, tool, kwargs))
+        finally:
+            if self.executor is None:
+                executor.shutdown()
+            self.cost_model.save()
+        return pd.DataFrame(report, columns=REPORT_COLUMNS)
+
+    def _run_stage(self, executor, tool, kwargs):
+        """Feed the tasks of one stage to the executor and report the per-participant completion"""
+        stage = tool.__name__
+        tasks = self.tasks(tool, kwargs)
+        n_participants = len({participant for participant, _, _ in tasks})
+        print(f'{stage}: {len(tasks)} trials of {n_participants} participants')
+
+        # longest trials first, so that a long trial does not end up alone at the end of the stage
+        tasks.sort(key=lambda task: self._estimate(tool, task[0], task[1]), reverse=True)
+        futures = {
+            executor.submit(function, trial): (participant, trial)
+            for participant, trial, function in tasks
+        }
+        remaining = pd.Series([participant for participant, _, _ in tasks]).value_counts().to_dict()
+        trials = {participant: [] for participant in remaining}
+        for future in as_completed(futures):
+            participant, trial = futures[future]
+            trials[participant].append(future.result())
+            self._record(tool, participant, trial, trials[participant][-1])
+            remaining[participant] -= 1
+            if not remaining[participant]:
+                failed = sum(itrial.status == 'failed' for itrial in trials[participant])
+                print(f'\t{participant} done ({len(trials[participant])} trials, {failed} failed)')
+
+        return self._report({
+            (participant, stage): stage_trials for participant, stage_trials in trials.items()
+        })
+
+    def _estimate(self, tool, participant, trial):
+        """Estimated cost of a trial (see `CostModel`)"""
+        return self.cost_model.estimate(trial, tool.__name__, self._models.get((participant, tool)))
+
+    def _record(self, tool, participant, trial, result):
+        """Add the run time of a trial to the cost model history"""
+        if result.status == 'done':
+            model = self._models.get((participant, tool))
+            self.cost_model.record(trial, tool.__name__, result.seconds, model)
+
+    def _report(self, trials):
+        """Store the ToolResults of each (participant, stage) and flatten them into report rows"""
+        report = []
+        for (participant, stage), stage_trials in trials.items():
+            self.results[(participant, stage)] = ToolResults(stage, stage_trials)
+            report.extend(
+                {
+                    'participant': participant,
+                    'stage': stage,
+                    'trial': itrial.name,
+                    'status': itrial.status,
+                    'seconds': itrial.seconds,
+                    'cache_hits': itrial.cache['hits'],
+                    'cache_misses': itrial.cache['misses'],
+                }
+                for itrial in stage_trials
+            )
+        return report
+
+
+class PipelineRunner(CohortRunner):
+    """
+    Run tools on all the participants to process, scheduling each trial as soon as its inputs exist:
+    the inverse dynamic of a trial starts once its inverse kinematic is done, without
+    waiting for the other trials (see `DEPENDENCIES`). A dependency missing from `stages` is
+    replaced by its own dependencies (with only the inverse kinematic and the joint
+    reaction, the joint reaction follows the inverse kinematic). The stages without
+    dependency in `stages` are the roots, their inputs are read from the participant layout.
+    The outputs needed by a dependent stage are passed to its trial (see `FORWARDED_OUTPUTS`),
+    e.g. the joint reaction of a trial reads the muscle forces of its static optimization.
+    A trial is skipped in a stage if one of its dependencies failed or was skipped.
+
+    Parameters
+    ----------
+    conf : Conf
+        Project configuration
+    stages : list
+        List of (tool class, function returning the tool keyword arguments of a participant).
+        The function is called with the participant and the conf
+    executor : Executor, optional
+        Persistent executor (a new one, shut down at the end of `run`, by default)
+    participants : list, optional
+        Participants to process (`conf.get_participants_to_process()` by default)
+    dependencies : dict, optional
+        Stages needed by each tool (`DEPENDENCIES` by default)
+    cost_model : CostModel, optional
+        Run time estimates used to start the longest trials first
+        (history kept in the project `_run_times.json` by default)
+
+    Examples
+    --------
+    >>> from pyosim import Conf, PipelineRunner
+    >>> from pyosim import InverseKinematics, InverseDynamics, StaticOptimization, JointReaction
+    >>>
+    >>> runner = PipelineRunner(
+    >>>     Conf(project_path=PROJECT_PATH),
+    >>>     stages=[
+    >>>         (InverseKinematics, ik_kwargs),
+    >>>         (InverseDynamics, id_kwargs),
+    >>>         (StaticOptimization, so_kwargs),
+    >>>         (JointReaction, jr_kwargs),
+    >>>     ],
+    >>> )
+    >>> report = runner.run()
+    """
+
+    def __init__(self, conf, stages, executor=None, participants=None, dependencies=None,
+                 cost_model=None):
+        super().__init__(conf, stages, executor=executor, participants=participants,
+                         cost_model=cost_model)
+        self.dependencies = dependencies or DEPENDENCIES
+
+    def run(self):
+        """
+        Run all the stages, each trial moving to the next stage as soon as it is ready
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per task with the `REPORT_COLUMNS` columns
+            (model cache hits and misses during the trial included)
+            (the ToolResults per participant and stage are in `self.results`)
+        """
+        executor = self.executor or Executor()
+        executor.start()
+        try:
+            trials = self._run_graph(executor)
+        finally:
+            if self.executor is None:
+                executor.shutdown()
+            self.cost_model.save()
+        return pd.DataFrame(self._report(trials), columns=REPORT_COLUMNS)
+
+    def _needs(self, tool):
+        """
+        Nearest ancestors of a tool among the selected stages
+        (the graph is walked through the missing stages)
+        """
+        stages = dict(self.stages)
+        needs = []
+        for parent in self.dependencies.get(tool, []):
+            for ancestor in [parent] if parent in stages else self._needs(parent):
+                if ancestor not in needs:
+                    needs.append(ancestor)
+        return needs
+
+    def _run_graph(self, executor):
+        """
+        Schedule the tasks of all stages as their dependencies complete,
+        returning the TrialResults per stage
+        """
+        stages = dict(self.stages)
+        children = {
+            tool: [child for child in stages if tool in self._needs(child)] for tool in stages
+        }
+        functions, trials, pending = {}, {}, {}
+        # per (participant, root trial): input of the downstream
+        # stages, status and result of each finished stage
+        sources, done, results = {}, {}, {}
+
+        def submit(tool, participant, lineage):
+            if (participant, tool) not in functions:
+                functions[(participant, tool)] = self._function(
+                    tool, stages[tool], participant, [sources[lineage]]
+                )
+            kwargs = {}
+            for parent in self._needs(tool):
+                if (parent, tool) in FORWARDED_OUTPUTS:
+                    argument, contains = FORWARDED_OUTPUTS[(parent, tool)]
+                    kwargs[argument] = results[lineage][parent].get_output(contains)
+            future = executor.submit(functions[(participant, tool)], sources[lineage], **kwargs)
+            pending[future] = (tool, participant, lineage)
+
+        roots = [
+            (tool, participant, trial)
+            for tool in stages if not self._needs(tool)
+            for participant in self.participants
+            for trial in self.trials(tool, participant)
+        ]
+        for tool, participant, trial in roots:
+            # the tool instances are set up first, to know the models used by the cost estimates
+            sources[(participant, trial)] = trial
+            done[(participant, trial)] = {}
+            results[(participant, trial)] = {}
+            if (participant, tool) not in functions:
+                functions[(participant, tool)] = self._function(
+                    tool, stages[tool], participant, [trial]
+                )
+        # longest first (the whole chain of stages of a trial follows its root)
+        roots.sort(key=lambda root: self._estimate(*root), reverse=True)
+        for tool, participant, trial in roots:
+            submit(tool, participant, (participant, trial))
+        print(f'{len(pending)} root tasks submitted')
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                tool, participant, lineage = pending.pop(future)
+                result = future.result()
+                trials.setdefault((participant, tool.__name__), []).append(result)
+                self._record(tool, participant, sources[lineage], result)
+                done[lineage][tool] = result.status
+                results[lineage][tool] = result
+                if tool is InverseKinematics and result.status == 'done':
+                    sources[lineage] = result.outputs[0]
+                print(f'\t{participant} {tool.__name__} {result.name}: {result.status}')
+
+                for child in children[tool]:
+                    needs = self._needs(child)
+                    ready = all(parent in done[lineage] for parent in needs)
+                    if child in done[lineage] or not ready:
+                        continue
+                    if all(done[lineage][parent] == 'done' for parent in needs):
+                        submit(child, participant, lineage)
+                    else:
+                        self._skip(child, participant, lineage, sources, done, trials)
+        return trials
+
+    def _skip(self, tool, participant, lineage, sources, done, trials):
+        """Mark a trial as skipped in a stage and in all the stages depending on it"""
+        done[lineage][tool] = 'skipped'
+        skipped = TrialResult(sources[lineage], status='skipped')
+        trials.setdefault((participant, tool.__name__), []).append(skipped)
+        for child, _ in self.stages:
+            if tool in self._needs(child) and child not in done[lineage]:
+                self._skip(child, participant, lineage, sources, done, trials)
@@ -0,0 +1,202 @@
+"""
+Compressed files handling in pyosim.
+trc, mot and sto files can be stored compressed (e.g. `trial.trc.gz`,
+`trial.sto.zst`): pyosim's readers and writers handle them transparently, and the
+files are decompressed in a scratch directory when OpenSim needs plain files.
+"""
+import bz2
+import gzip
+import io
+import lzma
+import shutil
+import tempfile
+from pathlib import Path
+
+COMPRESSION_SUFFIXES = ('.gz', '.bz2', '.xz', '.zst')
+
+
+def is_compressed(filename):
+    """True if `filename` has a compression suffix (.gz, .bz2, .xz or .zst)"""
+    return Path(filename).suffix.lower() in COMPRESSION_SUFFIXES
+
+
+def strip_compression(filename):
+    """
+    Remove the compression suffix of a filename (`trial.trc.gz` -> `trial.trc`)
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file
+
+    Returns
+    -------
+    Path
+    """
+    filename = Path(filename)
+    return filename.with_suffix('') if is_compressed(filename) else filename
+
+
+def open_file(filename, mode='rb'):
+    """
+    Open a plain or compressed file in binary mode, the compression being deduced from the suffix.
+    Compressed files are not seekable backward (except gzip, slowly).
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file
+    mode : str, optional
+        'rb' or 'wb'
+
+    Returns
+    -------
+    file object
+    """
+    filename = Path(filename)
+    suffix = filename.suffix.lower()
+    if suffix == '.gz':
+        return gzip.open(filename, mode)
+    if suffix == '.bz2':
+        return bz2.open(filename, mode)
+    if suffix == '.xz':
+        return lzma.open(filename, mode)
+    if suffix == '.zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                'zstandard must be installed to handle .zst files: `conda install zstandard`'
+            )
+        file = zstandard.open(filename, mode)
+        return io.BufferedReader(file) if 'r' in mode else file
+    return open(filename, mode)
+
+
+def find_file(filename):
+    """
+    Get the existing version of a file, plain or compressed (`trial.sto` or `trial.sto.gz`, etc.)
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the plain file
+
+    Returns
+    -------
+    Path
+    """
+    filename = Path(filename)
+    if filename.is_file():
+        return filename
+    for suffix in COMPRESSION_SUFFIXES:
+        compressed = filename.with_name(f'{filename.name}{suffix}')
+        if compressed.is_file():
+            return compressed
+    raise FileNotFoundError(f'{filename} does not exist (plain or compressed)')
+
+
+def compress_file(filename, output=None, compression='.gz', remove=True):
+    """
+    Compress a plain file
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the plain file
+    output : str, Path, optional
+        Path of the compressed file (`filename` + `compression` by default)
+    compression : str, optional
+        Compression suffix (.gz, .bz2, .xz or .zst)
+    remove : bool, optional
+        Remove the plain file if True
+
+    Returns
+    -------
+    Path
+        Path of the compressed file
+    """
+    filename = Path(filename)
+    output = Path(output) if output else filename.with_name(f'{filename.name}{compression}')
+    with open(filename, 'rb') as source, open_file(output, 'wb') as destination:
+        shutil.copyfileobj(source, destination, length=2 ** 24)
+    if remove:
+        filename.unlink()
+    return output
+
+
+def scratch_directory(directory=None):
+    """
+    Create a new temporary directory, private to the caller
+    (concurrent tasks never share their scratch files)
+
+    Parameters
+    ----------
+    directory : str, Path, optional
+        Parent directory (the system temporary directory by default)
+
+    Returns
+    -------
+    Path
+        Path of the directory, removed by `remove_scratch` with its last file
+    """
+    return Path(tempfile.mkdtemp(prefix='pyosim_', dir=directory))
+
+
+def decompress_file(filename, directory=None):
+    """
+    Decompress a file in a new scratch directory, just in time for OpenSim
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the compressed file
+    directory : str, Path, optional
+        Parent of the scratch directory (the system temporary directory by default)
+
+    Returns
+    -------
+    Path
+        Path of the plain file, to be removed with `remove_scratch` once used
+    """
+    filename = Path(filename)
+    output = scratch_directory(directory) / strip_compression(filename).name
+    with open_file(filename, 'rb') as source, open(output, 'wb') as destination:
+        shutil.copyfileobj(source, destination, length=2 ** 24)
+    return output
+
+
+def remove_scratch(filename):
+    """
+    Remove a file decompressed by `decompress_file` and
+    its scratch directory if it is a pyosim temporary one
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the decompressed file
+    """
+    filename = Path(filename)
+    filename.unlink()
+    if filename.parent.name.startswith('pyosim_') and not any(filename.parent.iterdir()):
+        filename.parent.rmdir()
+
+
+def as_plain(filename, directory=None):
+    """
+    Get a plain version of a file: the file itself if
+    it is not compressed, a decompressed copy otherwise
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file
+    directory : str, Path, optional
+        Parent of the scratch directory of the decompressed
+        copy (the system temporary directory by default)
+
+    Returns
+    -------
+    Path
+    """
+    return decompress_file(filename, directory) if is_compressed(filename) else Path(filename)
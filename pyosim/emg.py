@@ -0,0 +1,191 @@
+"""
+EMG processing in pyosim.
+Envelopes are computed for all channels at once, normalized by the
+maximum over all the MVC trials of a participant and written in `0_emg`.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.signal import butter, filtfilt
+
+from pyosim.analogs import Analogs3dOsim
+from pyosim.compression import strip_compression
+
+
+def read_emg(filename, names=None):
+    """
+    Read the EMG channels of a c3d or sto file
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the c3d or sto (possibly compressed) file
+    names : list, optional
+        Channels to read (all by default)
+
+    Returns
+    -------
+    Analogs3dOsim
+    """
+    if strip_compression(filename).suffix.lower() == '.c3d':
+        return Analogs3dOsim.from_c3d(f'{filename}', names=names)
+    return Analogs3dOsim.from_sto(filename, names=names)
+
+
+def emg_envelope(emg, band_pass=(10, 425), low_pass=5, order=4):
+    """
+    Band-pass, rectify and low-pass all the EMG channels at once
+
+    Parameters
+    ----------
+    emg : Analogs3dOsim
+        Raw EMG, with `get_rate` filled
+    band_pass : tuple, optional
+        Band-pass cutoff frequencies (Hz), no band-pass if None
+    low_pass : float, optional
+        Cutoff frequency of the envelope (Hz)
+    order : int, optional
+        Order of the Butterworth filters
+
+    Returns
+    -------
+    Analogs3dOsim
+        Envelope, with the same metadata
+    """
+    if not emg.get_rate:
+        raise ValueError(
+            'get_rate is empty. Please fill with `your_variable.get_rate = 2000.0` for example'
+        )
+    nyquist = emg.get_rate / 2
+    data = np.asarray(emg, dtype=np.float64).reshape(-1, emg.shape[-1])
+    if band_pass:
+        cutoffs = [band_pass[0] / nyquist, min(band_pass[1] / nyquist, 0.99)]
+        data = filtfilt(*butter(order, cutoffs, 'bandpass'), data, axis=-1)
+    data = np.abs(data - data.mean(axis=-1, keepdims=True))
+    data = filtfilt(*butter(order, low_pass / nyquist), data, axis=-1)
+
+    envelope = Analogs3dOsim(data[np.newaxis, ...])
+    envelope.get_rate = emg.get_rate
+    envelope.get_labels = emg.get_labels
+    envelope.get_unit = emg.get_unit
+    return envelope
+
+
+def mvc_maxima(mvc_files, names=None, **envelope_kwargs):
+    """
+    Maximum envelope of each channel over all the MVC trials,
+    in one streaming pass (one trial in memory at a time)
+
+    Parameters
+    ----------
+    mvc_files : list
+        Paths of the MVC trials (c3d or sto)
+    names : list, optional
+        Channels to read (all by default)
+    envelope_kwargs
+        Keyword arguments passed to `emg_envelope`
+
+    Returns
+    -------
+    pandas.Series
+        Maximum of each channel, with the channels labels as index
+    """
+    maxima, labels = None, None
+    for ifile in mvc_files:
+        envelope = emg_envelope(read_emg(ifile, names=names), **envelope_kwargs)
+        if labels is None:
+            labels = list(envelope.get_labels)
+            maxima = np.full(len(labels), -np.inf)
+        elif list(envelope.get_labels) != labels:
+            raise ValueError(f'channels of {ifile} differ from the ones of the previous MVC trials')
+        maxima = np.maximum(maxima, np.nanmax(envelope[0, ...], axis=-1))
+    if maxima is None:
+        raise ValueError('no MVC trial')
+    return pd.Series(maxima, index=labels)
+
+
+def _normalize(filename, output, mvc, names, envelope_kwargs, sto_kwargs):
+    """Normalize one trial and write it, returning its timing"""
+    tic = time.perf_counter()
+    envelope = emg_envelope(read_emg(filename, names=names), **envelope_kwargs)
+    labels = list(envelope.get_labels)
+    envelope /= mvc.loc[labels].values.reshape(1, -1, 1)
+    envelope.to_sto(output, **sto_kwargs)
+    return {
+        'file': f'{output}',
+        'seconds': time.perf_counter() - tic,
+        'bytes': Path(output).stat().st_size,
+    }
+
+
+def normalize_emg(files, mvc, output_dir, names=None, workers=None, compression=None,
+                  envelope_kwargs=None, sto_kwargs=None):
+    """
+    Compute the envelope of many trials in a process pool,
+    normalize it by the MVC maxima and write sto files
+
+    Parameters
+    ----------
+    files : list
+        Paths of the trials (c3d or sto)
+    mvc : pandas.Series
+        Maximum of each channel (see `mvc_maxima`)
+    output_dir : str, Path
+        Output directory (typically the participant `0_emg` directory)
+    names : list, optional
+        Channels to read (all by default)
+    workers : int, optional
+        Number of processes (number of cpu by default)
+    compression : str, optional
+        Compress the output files with this suffix (e.g. '.gz')
+    envelope_kwargs : dict, optional
+        Keyword arguments passed to `emg_envelope`
+    sto_kwargs : dict, optional
+        Keyword arguments passed to `Analogs3dOsim.to_sto`
+        (e.g. `time` to align the EMG with the markers)
+
+    Returns
+    -------
+    pandas.DataFrame
+        Per-file timing (`seconds`) and size (`bytes`)
+
+    Examples
+    --------
+    >>> from pathlib import Path
+    >>> from pyosim import mvc_maxima, normalize_emg
+    >>>
+    >>> PROJECT_PATH = Path('../Misc/project_sample')
+    >>> participant = 'dapo'
+    >>> raw = Path('/media/data/dapo')
+    >>> muscles = ['Voltage.13', 'Voltage.14', 'Voltage.15']
+    >>>
+    >>> mvc = mvc_maxima(raw.glob('*MVC*.c3d'), names=muscles)
+    >>> report = normalize_emg(
+    >>>     [ifile for ifile in raw.glob('*.c3d') if 'MVC' not in ifile.stem],
+    >>>     mvc,
+    >>>     output_dir=PROJECT_PATH / participant / '0_emg',
+    >>>     names=muscles
+    >>> )
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    suffix = compression or ''
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [
+            pool.submit(
+                _normalize,
+                ifile,
+                output_dir / f'{strip_compression(Path(ifile)).stem}.sto{suffix}',
+                mvc,
+                names,
+                envelope_kwargs or {},
+                sto_kwargs or {},
+            )
+            for ifile in files
+        ]
+        report = [future.result() for future in futures]
+    return pd.DataFrame(report, columns=['file', 'seconds', 'bytes'])
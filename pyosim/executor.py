@@ -0,0 +1,91 @@
+"""
+Persistent executor shared by the pyosim tools
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from pyosim.model import init_model_cache
+
+
+class Executor:
+    """
+    Pool of worker processes spawned once and reused across tools, stages and participants.
+    Each worker imports opensim and sets up its model cache once.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Number of processes (number of cpu by default)
+    model_cache_size : int, optional
+        Maximum number of models cached by each worker (see `ModelCache`)
+
+    Examples
+    --------
+    >>> from pyosim import Executor, InverseKinematics, InverseDynamics
+    >>>
+    >>> with Executor() as executor:
+    >>>     for participant in conf.get_participants_to_process():
+    >>>         InverseKinematics(..., executor=executor)
+    >>>         InverseDynamics(..., executor=executor)
+    """
+
+    def __init__(self, workers=None, model_cache_size=4):
+        self.workers = workers or os.cpu_count()
+        self.model_cache_size = model_cache_size
+        self._pool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def __getstate__(self):
+        # the pool stays in the parent process (the tools
+        # holding the executor are sent to the workers)
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+    def start(self):
+        """Spawn the workers (nothing is done if they are already running)"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=init_model_cache,
+                initargs=(self.model_cache_size,),
+            )
+
+    def shutdown(self, wait=True):
+        """Stop the workers once the pending tasks are done"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Schedule `function(*args, **kwargs)` on a worker
+
+        Returns
+        -------
+        concurrent.futures.Future
+        """
+        if self._pool is None:
+            raise ValueError(
+                'the executor is not started. '
+                'Use `with Executor() as executor:` or `executor.start()`'
+            )
+        return self._pool.submit(function, *args, **kwargs)
+
+    def map(self, function, iterable):
+        """
+        Apply `function` to each element of `iterable` on the workers
+
+        Returns
+        -------
+        list
+            Results, in the order of `iterable`
+        """
+        futures = [self.submit(function, item) for item in iterable]
+        return [future.result() for future in futures]
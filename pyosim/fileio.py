@@ -0,0 +1,1174 @@
+"""
+File input/output utilities in pyosim.
+Compressed files (e.g. `trial.trc.gz`, `trial.sto.zst`) are handled transparently.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pyosim.compression import open_file, is_compressed, strip_compression, compress_file
+
+# number of frames formatted at once by the bulk writers
+CHUNK_SIZE = 10000
+
+# precision used by OpenSim's file adapters (std::numeric_limits<double>::digits10 + 1)
+OSIM_PRECISION = 16
+
+# length units, in meters
+UNITS = {'mm': 1e-3, 'cm': 1e-2, 'dm': 1e-1, 'm': 1.0}
+
+# project-level precision policy: significant digits
+# written per quantity type (None for full precision)
+# and dtype of the arrays returned by the readers
+PRECISION = {
+    'markers': None,
+    'angles': None,
+    'moments': None,
+    'forces': None,
+    'analogs': None,
+    'dtype': np.float64,
+}
+
+
+def set_precision(dtype=None, **digits):
+    """
+    Set the project-level precision policy
+
+    Parameters
+    ----------
+    dtype : numpy.dtype, optional
+        dtype of the arrays returned by the readers (e.g. `np.float32` to halve the memory)
+    digits : int
+        Significant digits written per quantity type (`markers`, `angles`, `moments`, `forces`,
+        `analogs`), None for full precision
+
+    Notes
+    -----
+    The policy is a module global of the current process: the workers of an already started
+    `Executor` do not see a later change. The tools resolve their `digits` at instantiation, in the
+    parent process, so set the policy before creating the tools.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from pyosim import set_precision
+    >>>
+    >>> set_precision(markers=6, angles=6, moments=5, forces=5, dtype=np.float32)
+    """
+    unknown = set(digits).difference(PRECISION)
+    if unknown:
+        raise ValueError(f'{unknown} are not quantity types. Choose from {list(PRECISION)}')
+    PRECISION.update(digits)
+    if dtype is not None:
+        PRECISION['dtype'] = np.dtype(dtype).type
+
+
+def get_precision(quantity):
+    """
+    Get the significant digits written for a quantity
+    type, or the readers' dtype with `quantity='dtype'`
+
+    Parameters
+    ----------
+    quantity : str
+        `markers`, `angles`, `moments`, `forces`, `analogs` or `dtype`
+    """
+    return PRECISION[quantity]
+
+
+def _value_format(digits=None):
+    """
+    printf-style format of a value written with `digits`
+    significant digits (OpenSim's precision by default)
+    """
+    return f'%.{digits or OSIM_PRECISION}g'
+
+
+def time_vector(n_frames, rate, first_frame=0):
+    """
+    Get the time vector associated with a regularly sampled signal
+
+    Parameters
+    ----------
+    n_frames : int
+        Number of frames
+    rate : float
+        Sampling rate (Hz)
+    first_frame : int, optional
+        Index of the first frame
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    return np.arange(first_frame, first_frame + n_frames) * (1 / rate)
+
+
+def _format_block(block, row_format):
+    """
+    Format a (n_rows, n_columns) block in one pass, one line per row
+
+    Parameters
+    ----------
+    block : numpy.ndarray
+        Block to format
+    row_format : str
+        printf-style format of one row (with the end of line)
+
+    Returns
+    -------
+    str
+    """
+    return (row_format * block.shape[0]) % tuple(block.ravel().tolist())
+
+
+def frame_blocks(data, chunk_size=CHUNK_SIZE):
+    """
+    Iterate over an array (e.g. a `numpy.memmap`) by
+    blocks of frames, the last axis being the frames
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Array with the frames on the last axis
+    chunk_size : int, optional
+        Number of frames per block
+
+    Yields
+    ------
+    numpy.ndarray
+    """
+    for first in range(0, data.shape[-1], chunk_size):
+        yield data[..., first:first + chunk_size]
+
+
+class _StreamWriter:
+    """
+    Base class of the streaming writers.
+    The header is written up front and the frame count
+    is patched at close if it was not known beforehand.
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file to write
+    rate : float
+        Sampling rate (Hz)
+    n_frames : int, optional
+        Number of frames to write, if known beforehand
+    chunk_size : int, optional
+        Number of frames formatted at once
+    time : numpy.ndarray, optional
+        Time vector of all the frames (regularly sampled from 0 at `rate` by default)
+    """
+
+    # width reserved for the frame count when it has to be patched at close
+    COUNT_WIDTH = 12
+
+    def __init__(self, filename, rate, n_frames=None, chunk_size=CHUNK_SIZE, time=None):
+        self.filename = Path(filename)
+        self.rate = rate
+        self.time = None if time is None else np.asarray(time, dtype=np.float64)
+        self.n_frames = n_frames
+        self.chunk_size = chunk_size
+        self.count = 0
+        self._file = None
+        self._count_offsets = []
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # the error raised while writing is kept, the partial file is removed
+            self.abort()
+
+    def open(self):
+        if is_compressed(self.filename) and self.n_frames is None:
+            # the frame count cannot be patched in a compressed
+            # stream: write a plain file, compressed at close
+            self._file = open(self._part_filename(), 'wb')
+        else:
+            self._file = open_file(self.filename, 'wb')
+        self._count_offsets = []
+        self.count = 0
+        for part in self._header():
+            if part is None:
+                # frame count field
+                self._count_offsets.append(self._file.tell())
+                part = '0'.ljust(self.COUNT_WIDTH) if self.n_frames is None else str(self.n_frames)
+            self._file.write(part.encode())
+
+    def write(self, block):
+        """
+        Append a block of frames to the file
+
+        Parameters
+        ----------
+        block : numpy.ndarray
+            Block of frames, the last axis being the frames
+        """
+        if self._file is None:
+            raise ValueError(f'{self.filename} is not opened')
+        for sub_block in frame_blocks(block, self.chunk_size):
+            self._file.write(self._format(np.asarray(sub_block), first_frame=self.count).encode())
+            self.count += sub_block.shape[-1]
+
+    def close(self):
+        if self._file is None:
+            return
+        if self.n_frames is None:
+            for offset in self._count_offsets:
+                self._file.seek(offset)
+                self._file.write(str(self.count).ljust(self.COUNT_WIDTH).encode())
+        self._file.close()
+        self._file = None
+        if is_compressed(self.filename) and self.n_frames is None:
+            compress_file(self._part_filename(), output=self.filename)
+        if self.n_frames is not None and self.count != self.n_frames:
+            raise ValueError(
+                f'{self.filename}: {self.count} frames written, {self.n_frames} expected'
+            )
+
+    def abort(self):
+        """Close the file without checking the frame count and remove it"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if is_compressed(self.filename) and self.n_frames is None:
+            self._part_filename().unlink()
+        else:
+            self.filename.unlink()
+
+    def _part_filename(self):
+        return self.filename.with_name(f'{self.filename.name}.part')
+
+    def _header(self):
+        """Header parts to write, `None` marking the frame count fields"""
+        raise NotImplementedError
+
+    def _format(self, block, first_frame):
+        """Format a block of frames starting at `first_frame`"""
+        raise NotImplementedError
+
+    def _time(self, first_frame, n_frames):
+        """Time of a block of frames starting at `first_frame`"""
+        if self.time is None:
+            return time_vector(n_frames, self.rate, first_frame=first_frame)
+        if first_frame + n_frames > self.time.size:
+            raise ValueError(
+                f'time vector of {self.time.size} frames '
+                f'for at least {first_frame + n_frames} frames'
+            )
+        return self.time[first_frame:first_frame + n_frames]
+
+
+class TrcWriter(_StreamWriter):
+    """
+    Streaming trc writer.
+    The output is byte-compatible with the one written by `osim.TRCFileAdapter`.
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file to write
+    labels : list
+        Markers labels
+    rate : float
+        Sampling rate (Hz)
+    unit : str
+        Markers unit (e.g. "mm")
+    n_frames : int, optional
+        Number of frames to write, if known beforehand
+    decimals : int, optional
+        Number of decimals kept in the markers position, in
+        `unit` (scaled with `output_unit`). None to keep them all
+    digits : int, optional
+        Significant digits written for the markers position (full precision by default)
+    chunk_size : int, optional
+        Number of frames formatted at once
+    rotation : numpy.ndarray, optional
+        (3, 3) rotation matrix applied to the markers position (e.g. lab Z-up to OpenSim Y-up)
+    translation : numpy.ndarray, optional
+        Translation added after the rotation, in `output_unit`
+    output_unit : str, optional
+        Unit written (one of `UNITS`), the markers position
+        being scaled from `unit` (`unit` by default)
+    time : numpy.ndarray, optional
+        Time vector of all the frames (regularly sampled from 0 at `rate` by default)
+    frames : numpy.ndarray, optional
+        Frame numbers of all the frames (numbered from 1 by default)
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from pyosim import TrcWriter, frame_blocks
+    >>>
+    >>> data = np.load('markers.npy', mmap_mode='r')  # (3, n_markers, n_frames)
+    >>> with TrcWriter('markers.trc', labels=['M1', 'M2'], rate=100, unit='mm') as writer:
+    >>>     for block in frame_blocks(data):
+    >>>         writer.write(block)
+    """
+
+    def __init__(self, filename, labels, rate, unit, n_frames=None, decimals=4, digits=None,
+                 chunk_size=CHUNK_SIZE, rotation=None, translation=None, output_unit=None,
+                 time=None, frames=None):
+        super().__init__(filename, rate, n_frames=n_frames, chunk_size=chunk_size, time=time)
+        self.frames = None if frames is None else np.asarray(frames)
+        self.labels = list(labels)
+        self.unit = output_unit or unit
+
+        # rotation and unit scaling are fused in one
+        # matrix, applied while filling the formatted rows
+        scale = 1.0
+        if output_unit and output_unit != unit:
+            if unit not in UNITS or output_unit not in UNITS:
+                raise ValueError(
+                    f'units must be one of {list(UNITS)} to be converted ({unit} -> {output_unit})'
+                )
+            scale = UNITS[unit] / UNITS[output_unit]
+        # decimals are given in `unit`: mm with 4 decimals are m with 7 decimals
+        self.decimals = None if decimals is None else decimals - int(round(np.log10(scale)))
+        if rotation is None and scale == 1.0:
+            self._transform = None
+        else:
+            rotation = np.eye(3) if rotation is None else np.asarray(rotation, dtype=np.float64)
+            self._transform = scale * rotation
+        if translation is not None:
+            translation = np.asarray(translation, dtype=np.float64)
+        self._translation = translation
+        values_format = f'{_value_format(digits)}\t' * 3 * len(self.labels)
+        self._row_format = f'%d\t{_value_format()}\t{values_format}\n'
+
+    def _header(self):
+        n_markers = len(self.labels)
+        return [
+            f'PathFileType\t4\t(X/Y/Z)\t{self.filename}\n'
+            'DataRate\tCameraRate\tNumFrames\tNumMarkers\tUnits\t'
+            'OrigDataRate\tOrigDataStartFrame\tOrigNumFrames\n'
+            f'{self.rate}\t{self.rate}\t',
+            None,
+            f'\t{n_markers}\t{self.unit}\t{self.rate}\t0\t',
+            None,
+            '\n'
+            'Frame#\tTime\t' + ''.join(f'{label}\t\t\t' for label in self.labels) + '\n'
+            '\t\t' + ''.join(f'X{i}\tY{i}\tZ{i}\t' for i in range(1, n_markers + 1)) + '\n'
+            '\n'
+        ]
+
+    def _format(self, block, first_frame):
+        n_frames = block.shape[-1]
+        if block.shape[1] != len(self.labels):
+            raise ValueError(f'{len(self.labels)} labels for {block.shape[1]} markers')
+        rows = np.empty((n_frames, 2 + 3 * block.shape[1]))
+        if self.frames is None:
+            rows[:, 0] = np.arange(first_frame + 1, first_frame + n_frames + 1)
+        elif first_frame + n_frames > self.frames.size:
+            raise ValueError(
+                f'{self.frames.size} frame numbers for at least {first_frame + n_frames} frames'
+            )
+        else:
+            rows[:, 0] = self.frames[first_frame:first_frame + n_frames]
+        rows[:, 1] = self._time(first_frame, n_frames)
+        # (3, n_markers, n_frames) -> (n_frames, n_markers
+        # * [x, y, z]), written in place in the rows
+        positions = rows[:, 2:].reshape(n_frames, block.shape[1], 3)
+        if self._transform is None:
+            positions[...] = block[:3, ...].transpose(2, 1, 0)
+        else:
+            np.einsum('ij,jmf->fmi', self._transform, block[:3, ...], out=positions)
+        if self._translation is not None:
+            positions += self._translation
+        if self.decimals is not None:
+            np.round(rows[:, 2:], decimals=self.decimals, out=rows[:, 2:])
+        return _format_block(rows, self._row_format)
+
+
+class StoWriter(_StreamWriter):
+    """
+    Streaming sto writer.
+    The output follows the layout written by `osim.STOFileAdapter` and can be read back by it.
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file to write
+    labels : list
+        Channels labels
+    rate : float
+        Sampling rate (Hz)
+    metadata : dict, optional
+        Key-value pairs written in the header (`nColumns`, etc.). `nRows` is filled by the writer
+    opensim_version : str, optional
+        OpenSim version written in the header
+    n_frames : int, optional
+        Number of frames to write, if known beforehand
+    digits : int, optional
+        Significant digits written for the data (full precision by default)
+    chunk_size : int, optional
+        Number of frames formatted at once
+    time : numpy.ndarray, optional
+        Time vector of all the frames (regularly sampled from 0 at `rate` by default)
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from pyosim import StoWriter, frame_blocks
+    >>>
+    >>> data = np.load('emg.npy', mmap_mode='r')  # (n_channels, n_frames)
+    >>> with StoWriter('emg.sto', labels=['deltant', 'deltmed'], rate=2000) as writer:
+    >>>     for block in frame_blocks(data):
+    >>>         writer.write(block)
+    """
+
+    def __init__(self, filename, labels, rate, metadata=None, opensim_version=None, n_frames=None,
+                 digits=None, chunk_size=CHUNK_SIZE, time=None):
+        super().__init__(filename, rate, n_frames=n_frames, chunk_size=chunk_size, time=time)
+        self.labels = list(labels)
+        self.metadata = dict(metadata) if metadata else {}
+        self.metadata.pop('nRows', None)
+        self.opensim_version = opensim_version
+        formats = [_value_format()] + [_value_format(digits)] * len(self.labels)
+        self._row_format = '\t'.join(formats) + '\n'
+
+    def _header(self):
+        # OpenSim stores the metadata in a std::map, so the keys are written in sorted order
+        parts = [f"{self.metadata['header']}\n"] if 'header' in self.metadata else []
+        for key in sorted(list(self.metadata) + ['nRows']):
+            if key == 'nRows':
+                parts.extend(['nRows=', None, '\n'])
+            elif key != 'header':
+                parts.append(f'{key}={self.metadata[key]}\n')
+        parts.append('DataType=double\nversion=3\n')
+        if self.opensim_version:
+            parts.append(f'OpenSimVersion={self.opensim_version}\n')
+        parts.append('endheader\n' + '\t'.join(['time'] + self.labels) + '\n')
+        return parts
+
+    def _format(self, block, first_frame):
+        n_frames = block.shape[-1]
+        if block.shape[0] != len(self.labels):
+            raise ValueError(f'{len(self.labels)} labels for {block.shape[0]} channels')
+        rows = np.empty((n_frames, 1 + block.shape[0]))
+        rows[:, 0] = self._time(first_frame, n_frames)
+        rows[:, 1:] = block.T
+        return _format_block(rows, self._row_format)
+
+
+def write_trc(filename, data, labels, rate, unit, decimals=4, digits=None, chunk_size=CHUNK_SIZE,
+              rotation=None, translation=None, output_unit=None, time=None, frames=None):
+    """
+    Write a trc file in one vectorized pass.
+    The output is byte-compatible with the one written by `osim.TRCFileAdapter`.
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file to write
+    data : numpy.ndarray
+        Markers position with shape (3, n_markers, n_frames)
+    labels : list
+        Markers labels
+    rate : float
+        Sampling rate (Hz)
+    unit : str
+        Markers unit (e.g. "mm")
+    decimals : int, optional
+        Number of decimals kept in the markers position, in
+        `unit` (scaled with `output_unit`). None to keep them all
+    digits : int, optional
+        Significant digits written for the markers position (full precision by default)
+    chunk_size : int, optional
+        Number of frames formatted at once
+    rotation : numpy.ndarray, optional
+        (3, 3) rotation matrix applied to the markers position
+    translation : numpy.ndarray, optional
+        Translation added after the rotation, in `output_unit`
+    output_unit : str, optional
+        Unit written, the markers position being scaled from `unit` (`unit` by default)
+    time : numpy.ndarray, optional
+        Time vector (regularly sampled from 0 at `rate` by default)
+    frames : numpy.ndarray, optional
+        Frame numbers (numbered from 1 by default)
+    """
+    with TrcWriter(filename, labels, rate, unit, n_frames=data.shape[-1], decimals=decimals,
+                   digits=digits, chunk_size=chunk_size, rotation=rotation, translation=translation,
+                   output_unit=output_unit, time=time, frames=frames) as writer:
+        writer.write(data)
+
+
+def write_sto(filename, data, labels, rate, metadata=None, opensim_version=None, digits=None,
+              chunk_size=CHUNK_SIZE, time=None):
+    """
+    Write a sto file in one vectorized pass.
+    The output follows the layout written by `osim.STOFileAdapter` and can be read back by it.
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file to write
+    data : numpy.ndarray
+        Data with shape (n_channels, n_frames)
+    labels : list
+        Channels labels
+    rate : float
+        Sampling rate (Hz)
+    metadata : dict, optional
+        Key-value pairs written in the header (`nColumns`, etc.). `nRows` is filled by the writer
+    opensim_version : str, optional
+        OpenSim version written in the header
+    digits : int, optional
+        Significant digits written for the data (full precision by default)
+    chunk_size : int, optional
+        Number of frames formatted at once
+    time : numpy.ndarray, optional
+        Time vector (regularly sampled from 0 at `rate` by default)
+    """
+    with StoWriter(filename, labels, rate, metadata=metadata, opensim_version=opensim_version,
+                   n_frames=data.shape[-1], digits=digits, chunk_size=chunk_size,
+                   time=time) as writer:
+        writer.write(data)
+
+
+def stream_trc(filename, blocks, labels, rate, unit, decimals=4, digits=None, rotation=None,
+               translation=None, output_unit=None):
+    """
+    Write a trc file from an iterator of frame blocks, keeping the memory bounded by the blocks size
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file to write
+    blocks : iterable
+        Blocks of markers position with shape (3, n_markers, n_frames_in_block)
+    labels : list
+        Markers labels
+    rate : float
+        Sampling rate (Hz)
+    unit : str
+        Markers unit (e.g. "mm")
+    decimals : int, optional
+        Number of decimals kept in the markers position, in
+        `unit` (scaled with `output_unit`). None to keep them all
+    digits : int, optional
+        Significant digits written for the markers position (full precision by default)
+    rotation : numpy.ndarray, optional
+        (3, 3) rotation matrix applied to the markers position
+    translation : numpy.ndarray, optional
+        Translation added after the rotation, in `output_unit`
+    output_unit : str, optional
+        Unit written, the markers position being scaled from `unit` (`unit` by default)
+
+    Returns
+    -------
+    int
+        Number of frames written
+    """
+    with TrcWriter(filename, labels, rate, unit, decimals=decimals, digits=digits,
+                   rotation=rotation, translation=translation, output_unit=output_unit) as writer:
+        for block in blocks:
+            writer.write(block)
+    return writer.count
+
+
+def stream_sto(filename, blocks, labels, rate, metadata=None, opensim_version=None, digits=None):
+    """
+    Write a sto file from an iterator of frame blocks, keeping the memory bounded by the blocks size
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file to write
+    blocks : iterable
+        Blocks of data with shape (n_channels, n_frames_in_block)
+    labels : list
+        Channels labels
+    rate : float
+        Sampling rate (Hz)
+    metadata : dict, optional
+        Key-value pairs written in the header (`nColumns`, etc.). `nRows` is filled by the writer
+    opensim_version : str, optional
+        OpenSim version written in the header
+    digits : int, optional
+        Significant digits written for the data (full precision by default)
+
+    Returns
+    -------
+    int
+        Number of frames written
+    """
+    with StoWriter(filename, labels, rate, metadata=metadata, opensim_version=opensim_version,
+                   digits=digits) as writer:
+        for block in blocks:
+            writer.write(block)
+    return writer.count
+
+
+def _skip_blank_lines(file):
+    """Move a binary file object to its next non-blank line"""
+    while True:
+        position = file.tell()
+        line = file.readline()
+        if not line or line.strip():
+            file.seek(position)
+            return position
+
+
+def read_trc_header(file):
+    """
+    Parse the header of a trc file and move the file object to the first data line
+
+    Parameters
+    ----------
+    file : file object
+        trc file opened in binary mode
+
+    Returns
+    -------
+    dict
+        `rate`, `unit`, `n_frames`, `labels` and `data_offset` (byte offset of the first data line)
+    """
+    file.readline()  # PathFileType
+    keys = file.readline().decode().rstrip('\r\n').split('\t')
+    values = file.readline().decode().rstrip('\r\n').split('\t')
+    metadata = dict(zip(keys, values))
+    n_markers = int(metadata['NumMarkers'])
+    labels = file.readline().decode().rstrip('\r\n').split('\t')[2:2 + 3 * n_markers:3]
+    file.readline()  # X1 Y1 Z1 ...
+    return {
+        'rate': float(metadata['DataRate']),
+        'unit': metadata['Units'],
+        'n_frames': int(metadata['NumFrames']),
+        'labels': [label.strip() for label in labels],
+        'data_offset': _skip_blank_lines(file),
+    }
+
+
+def _frames_window(file, rate, start=None, end=None):
+    """
+    Get the number of data lines to skip and to read to cover the time window [start, end],
+    assuming a regular sampling rate. The file object must be positioned at the first data line.
+
+    Returns
+    -------
+    tuple
+        (lines to skip, lines to read or None for the rest of the file)
+    """
+    position = file.tell()
+    first_line = file.readline()
+    file.seek(position)
+    if not first_line.strip():
+        return 0, None
+    first_time = float(first_line.split(b'\t')[1] if b'\t' in first_line else first_line.split()[0])
+    # one frame of margin on each side, the exact window is then selected on the time column
+    skip = max(0, int(np.floor((start - first_time) * rate)) - 1) if start is not None else 0
+    nrows = max(0, int(np.ceil((end - first_time) * rate)) + 2 - skip) if end is not None else None
+    return skip, nrows
+
+
+def _time_mask(time, start=None, end=None, tolerance=1e-9):
+    mask = np.ones(time.shape, dtype=bool)
+    if start is not None:
+        mask &= time >= start - tolerance
+    if end is not None:
+        mask &= time <= end + tolerance
+    return mask
+
+
+def read_trc(filename, names=None, start=None, end=None, dtype=None, exact=False):
+    """
+    Read a trc file with a vectorized parser.
+    Only the selected markers and the selected time window
+    are decoded, the rest of the file is not parsed.
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the trc file
+    names : list, optional
+        Markers to read (all by default)
+    start : float, optional
+        First time to read (s)
+    end : float, optional
+        Last time to read (s)
+    dtype : numpy.dtype, optional
+        dtype of the markers position (project-level policy by default, see `set_precision`)
+    exact : bool, optional
+        Parse the values as `float` does if True (about three times slower). The default parser
+        may differ from the written value in the last digit
+
+    Returns
+    -------
+    tuple
+        (data with shape (3, n_markers, n_frames), time vector, header).
+        The header holds the frame numbers of the frames read in `frames`
+    """
+    with open_file(filename, 'rb') as file:
+        header = read_trc_header(file)
+        if names is None:
+            names = header['labels']
+        missing = set(names).difference(header['labels'])
+        if missing:
+            raise ValueError(f'{missing} not in {filename}')
+        columns = [
+            2 + 3 * header['labels'].index(name) + axis for name in names for axis in range(3)
+        ]
+
+        skip, nrows = _frames_window(file, header['rate'], start, end)
+        dtype = dtype or get_precision('dtype')
+        values = np.empty((0, len(columns)), dtype=dtype)
+        time, frames = np.empty(0), np.empty(0, dtype=int)
+        try:
+            if nrows != 0:
+                values = pd.read_csv(
+                    file,
+                    sep='\t',
+                    header=None,
+                    usecols=[0, 1] + columns,
+                    skiprows=skip,
+                    nrows=nrows,
+                    dtype={icol: dtype for icol in columns},
+                    float_precision='round_trip' if exact else None,
+                )
+                time, frames = values[1].values.astype(float), values[0].values
+                values = values[columns].values
+        except pd.errors.EmptyDataError:
+            # the time window is past the end of the file: no frame
+            pass
+
+    mask = _time_mask(time, start, end)
+    data = values[mask].reshape(-1, len(names), 3).transpose(2, 1, 0)
+    header['labels'] = list(names)
+    header['frames'] = frames[mask]
+    return data, time[mask], header
+
+
+def read_sto_header(file):
+    """
+    Parse the header of a mot/sto file and move the file object to the first data line
+
+    Parameters
+    ----------
+    file : file object
+        mot/sto file opened in binary mode
+
+    Returns
+    -------
+    dict
+        `metadata` (key-value pairs), `labels` (with the time column) and `data_offset`
+        (byte offset of the first data line)
+    """
+    metadata = {}
+    while True:
+        line = file.readline()
+        if not line:
+            raise ValueError(f'{file.name} has no endheader line')
+        line = line.decode().strip()
+        if line == 'endheader':
+            break
+        if '=' in line:
+            key, value = line.split('=', 1)
+            metadata[key.strip()] = value.strip()
+        elif line and 'header' not in metadata:
+            metadata['header'] = line
+    _skip_blank_lines(file)
+    labels = file.readline().decode().split()
+    return {'metadata': metadata, 'labels': labels, 'data_offset': file.tell()}
+
+
+def count_frames(filename, block_size=2 ** 24):
+    """
+    Get the number of frames of a trc/mot/sto file from its header
+    (the data lines are counted if the header does not have it)
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file (plain or compressed)
+    block_size : int, optional
+        Size of the blocks read when counting the lines
+
+    Returns
+    -------
+    int
+    """
+    with open_file(filename, 'rb') as file:
+        if strip_compression(filename).suffix.lower() == '.trc':
+            return read_trc_header(file)['n_frames']
+        metadata = read_sto_header(file)['metadata']
+        for key in ('nRows', 'datarows'):
+            if key in metadata:
+                return int(metadata[key])
+        n_frames, last = 0, b'\n'
+        for block in iter(lambda: file.read(block_size), b''):
+            n_frames += block.count(b'\n')
+            last = block[-1:]
+        return n_frames + (last != b'\n')
+
+
+class TimeIndex:
+    """
+    Time to byte offset index of a mot/sto file, used for random access into large files.
+    It is stored in a sidecar file next to the indexed file (`<filename>.idx`)
+    and rebuilt automatically when the indexed file is modified.
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the indexed mot/sto file
+    times : numpy.ndarray
+        Sampled times
+    offsets : numpy.ndarray
+        Byte offset of the line of each sampled time
+    step : int
+        Number of data lines between two sampled times
+    mtime : float
+        Modification time of the indexed file when the index was built
+    size : int
+        Size of the indexed file when the index was built
+
+    Examples
+    --------
+    >>> from pyosim import StoFile, TimeIndex
+    >>>
+    >>> TimeIndex.build('wu_trial1.mot').save()
+    >>> time, angles = StoFile('wu_trial1.mot').read(start=600, end=605)  # seeks straight to t=600s
+    """
+
+    SUFFIX = '.idx'
+
+    def __init__(self, filename, times, offsets, step, mtime, size):
+        self.filename = Path(filename)
+        self.times = np.asarray(times, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.step = step
+        self.mtime = mtime
+        self.size = size
+
+    @classmethod
+    def sidecar(cls, filename):
+        """Path of the sidecar index of `filename`"""
+        filename = Path(filename)
+        return filename.with_name(f'{filename.name}{cls.SUFFIX}')
+
+    @classmethod
+    def build(cls, filename, step=100, block_size=2 ** 24):
+        """
+        Index a mot/sto file by scanning its line breaks (the data are not parsed)
+
+        Parameters
+        ----------
+        filename : str, Path
+            Path of the mot/sto file
+        step : int, optional
+            Number of data lines between two sampled times
+        block_size : int, optional
+            Number of bytes scanned at once
+
+        Returns
+        -------
+        TimeIndex
+        """
+        filename = Path(filename)
+        if is_compressed(filename):
+            raise ValueError(f'{filename} is compressed, compressed files cannot be indexed')
+        stat = filename.stat()
+        with open(filename, 'rb') as file:
+            data_offset = read_sto_header(file)['data_offset']
+            # keep the start of one line every `step` lines
+            # (the first line starts at the data offset)
+            offsets = [np.array([data_offset], dtype=np.int64)]
+            line = 1
+            position = data_offset
+            while True:
+                block = file.read(block_size)
+                if not block:
+                    break
+                newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+                starts = newlines + position + 1
+                offsets.append(starts[np.arange(line, line + starts.size) % step == 0])
+                line += starts.size
+                position += len(block)
+            offsets = np.concatenate(offsets)
+
+            times, kept = [], []
+            for offset in offsets[offsets < position]:
+                file.seek(offset)
+                fields = file.readline().split()
+                if fields:
+                    times.append(float(fields[0]))
+                    kept.append(offset)
+        return cls(filename, times, kept, step, stat.st_mtime, stat.st_size)
+
+    @classmethod
+    def load(cls, filename, build=True):
+        """
+        Load the sidecar index of a mot/sto file, rebuilding it if the file was modified since
+
+        Parameters
+        ----------
+        filename : str, Path
+            Path of the indexed mot/sto file
+        build : bool, optional
+            Build (and save) the index if there is no sidecar file
+
+        Returns
+        -------
+        TimeIndex, None
+            None if there is no sidecar and `build` is False
+        """
+        filename = Path(filename)
+        if is_compressed(filename):
+            return None
+        sidecar = cls.sidecar(filename)
+        if sidecar.is_file():
+            with open(sidecar) as file:
+                d = json.load(file)
+            index = cls(filename, d['times'], d['offsets'], d['step'], d['mtime'], d['size'])
+            if index.is_fresh():
+                return index
+            index = cls.build(filename, step=d['step'])
+        elif build:
+            index = cls.build(filename)
+        else:
+            return None
+        index.save()
+        return index
+
+    def is_fresh(self):
+        """True if the indexed file was not modified since the index was built"""
+        stat = self.filename.stat()
+        return stat.st_mtime == self.mtime and stat.st_size == self.size
+
+    def save(self):
+        """Write the index in its sidecar file"""
+        with open(self.sidecar(self.filename), 'w') as file:
+            json.dump({
+                'step': self.step,
+                'mtime': self.mtime,
+                'size': self.size,
+                'times': self.times.tolist(),
+                'offsets': self.offsets.tolist(),
+            }, file)
+        return self
+
+    def window(self, start=None, end=None):
+        """
+        Get the byte offset to seek and the number of lines
+        to read to cover the time window [start, end]
+
+        Parameters
+        ----------
+        start : float, optional
+            First time to read (s)
+        end : float, optional
+            Last time to read (s)
+
+        Returns
+        -------
+        tuple
+            (byte offset, number of lines or None for the rest of the file)
+        """
+        first = 0
+        if start is not None:
+            first = max(0, np.searchsorted(self.times, start, side='right') - 1)
+        nrows = None
+        if end is not None:
+            last = np.searchsorted(self.times, end, side='right')
+            if last < self.times.size:
+                nrows = (last - first) * self.step + 1
+        offset = self.offsets[first] if self.offsets.size else None
+        return offset, nrows
+
+
+class StoFile:
+    """
+    Lazy, column-selective reader of mot/sto files.
+    The header is parsed once at instantiation, the data are decoded on demand by `read`.
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the mot/sto file
+
+    Examples
+    --------
+    >>> from pyosim import StoFile
+    >>>
+    >>> sto = StoFile('wu_trial1_MuscleAnalysis_TendonForce.sto')
+    >>> time, forces = sto.read(names=['DELT1', 'DELT2'], start=0.5, end=1.5)
+    """
+
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        with open_file(self.filename, 'rb') as file:
+            header = read_sto_header(file)
+        self.metadata = header['metadata']
+        self.labels = header['labels']
+        self.data_offset = header['data_offset']
+        # labels without the time column
+        self.column_index = {label: icol for icol, label in enumerate(self.labels) if icol}
+
+    def read(self, names=None, start=None, end=None, chunk_size=CHUNK_SIZE, use_index=True,
+             dtype=None):
+        """
+        Decode the selected columns and time window
+
+        Parameters
+        ----------
+        names : list, optional
+            Columns to read (all by default)
+        start : float, optional
+            First time to read (s)
+        end : float, optional
+            Last time to read (s)
+        chunk_size : int, optional
+            Number of rows decoded at once, the reading stops at the first chunk past `end`
+        use_index : bool, optional
+            Seek straight to the time window with the
+            sidecar index (see `TimeIndex`), if there is one
+        dtype : numpy.dtype, optional
+            dtype of the data (project-level policy by default, see `set_precision`)
+
+        Returns
+        -------
+        tuple
+            (time vector, data with shape (n_columns, n_frames))
+        """
+        if names is None:
+            names = self.labels[1:]
+        missing = set(names).difference(self.column_index)
+        if missing:
+            raise ValueError(f'{missing} not in {self.filename}')
+        columns = [0] + [self.column_index[name] for name in names]
+
+        offset, nrows = self.data_offset, None
+        if use_index and (start is not None or end is not None):
+            index = TimeIndex.load(self.filename, build=False)
+            if index is not None and index.offsets.size:
+                offset, nrows = index.window(start, end)
+
+        dtype = dtype or get_precision('dtype')
+        times, chunks = [], []
+        with open_file(self.filename, 'rb') as file:
+            file.seek(offset)
+            try:
+                reader = pd.read_csv(
+                    file,
+                    sep=r'\s+',
+                    header=None,
+                    usecols=columns,
+                    nrows=nrows,
+                    dtype={icol: float if icol == 0 else dtype for icol in columns},
+                    chunksize=chunk_size,
+                )
+            except pd.errors.EmptyDataError:
+                # the time window is past the end of the file
+                reader = []
+            for chunk in reader:
+                time = chunk[0].values
+                mask = _time_mask(time, start, end)
+                times.append(time[mask])
+                chunks.append(chunk[columns[1:]].values[mask])
+                if end is not None and time[-1] > end:
+                    break
+        time = np.concatenate(times) if times else np.empty(0)
+        data = np.concatenate(chunks) if chunks else np.empty((0, len(columns) - 1), dtype=dtype)
+        return time, data.T
+
+
+def round_file(filename, digits, chunk_size=CHUNK_SIZE):
+    """
+    Rewrite the data of a mot/sto file (e.g. written by OpenSim) with `digits` significant digits.
+    The header is kept verbatim.
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the mot/sto file
+    digits : int
+        Significant digits written for the data (the time column is kept at full precision)
+    chunk_size : int, optional
+        Number of rows rewritten at once
+    """
+    filename = Path(filename)
+    part = filename.with_name(f'{filename.name}.part')
+    with open(filename, 'rb') as source, open(part, 'wb') as destination:
+        data_offset = read_sto_header(source)['data_offset']
+        source.seek(0)
+        destination.write(source.read(data_offset))
+        try:
+            chunks = pd.read_csv(source, sep=r'\s+', header=None, dtype=float, chunksize=chunk_size)
+        except pd.errors.EmptyDataError:
+            # no data line: the header is enough
+            chunks = []
+        for chunk in chunks:
+            values = chunk.values
+            row_format = '\t'.join(
+                [_value_format()] + [_value_format(digits)] * (values.shape[1] - 1)
+            ) + '\n'
+            destination.write(_format_block(values, row_format).encode())
+    part.replace(filename)
+
+
+def _last_line(file, block_size=4096):
+    """Get the last non-blank line of a binary file object by seeking from the end of the file"""
+    file.seek(0, 2)
+    end = file.tell()
+    position = end
+    tail = b''
+    while position > 0:
+        position = max(0, position - block_size)
+        file.seek(position)
+        tail = file.read(end - position)
+        lines = tail.splitlines()
+        # the first line of the block may be truncated, except at the beginning of the file
+        complete = lines if position == 0 else lines[1:]
+        for line in reversed(complete):
+            if line.strip():
+                return line
+    return b''
+
+
+def probe_time_range(filename):
+    """
+    Get the first and last times of a trc, mot or sto file without parsing the data.
+    Only the header, the first data line and the last data
+    line (seeking from the end of the file) are read.
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the file
+
+    Returns
+    -------
+    tuple
+        (first time, last time)
+    """
+    filename = Path(filename)
+    with open_file(filename, 'rb') as file:
+        if strip_compression(filename).suffix.lower() == '.trc':
+            read_trc_header(file)
+            time_column = 1
+        else:
+            read_sto_header(file)
+            time_column = 0
+        first_line = file.readline()
+        if is_compressed(filename):
+            # compressed streams cannot be seeked from the end
+            last_line = first_line
+            for line in file:
+                if line.strip():
+                    last_line = line
+        else:
+            last_line = _last_line(file)
+    if not first_line.strip():
+        raise ValueError(f'{filename} has no data')
+    return float(first_line.split()[time_column]), float(last_line.split()[time_column])
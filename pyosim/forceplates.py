@@ -0,0 +1,178 @@
+"""
+Force plates processing in pyosim.
+Raw analog channels are converted into the external loads (force, point and torque)
+read by OpenSim's ExternalLoads, all frames and plates being processed at once.
+"""
+import numpy as np
+
+from pyosim.analogs import Analogs3dOsim
+
+AXES = ['x', 'y', 'z']
+
+
+def read_calibration_matrix(filename):
+    """
+    Read a force plate calibration matrix (comma separated, 6 x 6)
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the csv file
+
+    Returns
+    -------
+    numpy.ndarray
+        Calibration matrix with shape (6, 6)
+    """
+    calibration = np.loadtxt(filename, delimiter=',')
+    if calibration.shape != (6, 6):
+        raise ValueError(f'calibration matrix must be 6 x 6, not {calibration.shape}')
+    return calibration
+
+
+def calibrate(voltages, calibration):
+    """
+    Apply the calibration matrices to the raw channels of all plates and frames
+
+    Parameters
+    ----------
+    voltages : numpy.ndarray
+        Raw channels with shape (n_plates, 6, n_frames)
+    calibration : numpy.ndarray
+        Calibration matrix with shape (6, 6), shared by all plates, or (n_plates, 6, 6)
+
+    Returns
+    -------
+    numpy.ndarray
+        Forces and moments (Fx, Fy, Fz, Mx, My, Mz) in the
+        plate frame, with shape (n_plates, 6, n_frames)
+    """
+    calibration = np.broadcast_to(calibration, (voltages.shape[0], 6, 6))
+    return np.einsum('pij,pjf->pif', calibration, voltages)
+
+
+def plate_kinetics(loads, surface_height=0.0, threshold=20.0):
+    """
+    Compute the center of pressure and the free moment
+    from the forces and moments measured by the plates.
+    Frames with a vertical force below `threshold` are set to zero.
+
+    Parameters
+    ----------
+    loads : numpy.ndarray
+        Forces and moments (Fx, Fy, Fz, Mx, My, Mz) in the
+        plate frame, with shape (n_plates, 6, n_frames)
+    surface_height : float, numpy.ndarray, optional
+        Height of the plate surface in the plate frame, per plate if array (m)
+    threshold : float, optional
+        Vertical force under which the plate is considered unloaded (N)
+
+    Returns
+    -------
+    tuple
+        (forces, center of pressure, free moment) with shapes
+        (n_plates, 3, n_frames), (n_plates, 3, n_frames)
+        and (n_plates, n_frames), in the plate frame
+    """
+    forces, moments = loads[:, :3, :], loads[:, 3:, :]
+    height = np.asarray(surface_height, dtype=float).reshape(-1, 1)
+    fz = forces[:, 2, :]
+    loaded = np.abs(fz) > threshold
+    fz = np.where(loaded, fz, 1.0)
+
+    cop = np.zeros_like(forces)
+    cop[:, 0, :] = (height * forces[:, 0, :] - moments[:, 1, :]) / fz
+    cop[:, 1, :] = (height * forces[:, 1, :] + moments[:, 0, :]) / fz
+    cop[:, 2, :] = height
+    free_moment = moments[:, 2, :] - cop[:, 0, :] * forces[:, 1, :] + cop[:, 1, :] * forces[:, 0, :]
+
+    forces = forces * loaded[:, np.newaxis, :]
+    cop = cop * loaded[:, np.newaxis, :]
+    free_moment = free_moment * loaded
+    return forces, cop, free_moment
+
+
+def external_loads(analogs, channels, calibration, rotation=None, position=None, surface_height=0.0,
+                   threshold=20.0, reaction=True, prefixes=None):
+    """
+    Convert the raw force plates channels of a Analogs3dOsim into external
+    loads, in the layout of the sto files read by OpenSim's ExternalLoads
+    (`<prefix>force_vx`, `<prefix>force_px`, `<prefix>torque_x`, etc.)
+
+    Parameters
+    ----------
+    analogs : Analogs3dOsim
+        Raw analogs, with `get_rate` and `get_labels` filled
+    channels : list
+        For each plate, the six channels labels (in the order of the calibration matrix columns)
+    calibration : numpy.ndarray
+        Calibration matrix with shape (6, 6), shared by all plates, or (n_plates, 6, 6)
+    rotation : numpy.ndarray, optional
+        Rotation from each plate frame to the OpenSim
+        global frame, with shape (3, 3) or (n_plates, 3, 3)
+        (identity by default)
+    position : numpy.ndarray, optional
+        Position of each plate origin in the OpenSim
+        global frame (m), with shape (3,) or (n_plates, 3)
+        (zero by default)
+    surface_height : float, numpy.ndarray, optional
+        Height of the plate surface in the plate frame, per plate if array (m)
+    threshold : float, optional
+        Vertical force under which the plate is considered unloaded (N)
+    reaction : bool, optional
+        Write the force applied by the plate on the body (opposite of the measured one) if True
+    prefixes : list, optional
+        Columns prefix of each plate (`1_ground_`, `2_ground_`, etc. by default)
+
+    Returns
+    -------
+    Analogs3dOsim
+        External loads at the rate of `analogs`, with 9 columns per plate
+
+    Examples
+    --------
+    >>> from pyosim import Analogs3dOsim, read_calibration_matrix, external_loads
+    >>>
+    >>> raw = Analogs3dOsim.from_c3d('trial.c3d')
+    >>> loads = external_loads(
+    >>>     raw,
+    >>>     channels=[[f'Voltage.{i}' for i in range(1, 7)]],
+    >>>     calibration=read_calibration_matrix('forces_calibration_matrix.csv'),
+    >>>     rotation=[[1, 0, 0], [0, 0, 1], [0, -1, 0]],  # z-up plate to y-up OpenSim
+    >>> )
+    >>> loads.to_sto('0_forces/trial.sto', quantity='forces')
+    """
+    n_plates = len(channels)
+    labels = list(analogs.get_labels)
+    missing = [channel for plate in channels for channel in plate if channel not in labels]
+    if missing:
+        raise ValueError(f'channels {missing} are not in the analogs')
+    index = np.array([[labels.index(channel) for channel in plate] for plate in channels])
+    voltages = np.asarray(analogs[0, ...])[index, :]
+
+    loads = calibrate(voltages, calibration)
+    forces, cop, free_moment = plate_kinetics(loads, surface_height, threshold)
+    if reaction:
+        forces, free_moment = -forces, -free_moment
+
+    # plate frames to the global frame
+    rotation = np.eye(3) if rotation is None else np.asarray(rotation, dtype=float)
+    rotation = np.broadcast_to(rotation, (n_plates, 3, 3))
+    position = np.zeros(3) if position is None else np.asarray(position, dtype=float)
+    position = np.broadcast_to(position, (n_plates, 3))
+    forces = np.einsum('pij,pjf->pif', rotation, forces)
+    cop = np.einsum('pij,pjf->pif', rotation, cop) + position[..., np.newaxis]
+    torques = rotation[:, :, 2, np.newaxis] * free_moment[:, np.newaxis, :]
+
+    # (n_plates, [force, point, torque] * xyz, n_frames)
+    data = np.concatenate([forces, cop, torques], axis=1).reshape(-1, analogs.shape[-1])
+    prefixes = prefixes or [f'{iplate + 1}_ground_' for iplate in range(n_plates)]
+    loads = Analogs3dOsim(data[np.newaxis, ...])
+    loads.get_rate = analogs.get_rate
+    loads.get_labels = [
+        f'{prefix}{quantity}{axis}'
+        for prefix in prefixes
+        for quantity in ['force_v', 'force_p', 'torque_']
+        for axis in AXES
+    ]
+    return loads
@@ -1,10 +1,27 @@
 """
 Inverse dynamic class in pyosim
 """
+from functools import partial
 from pathlib import Path
 
+import numpy as np
 import opensim as osim
 
+from pyosim.analogs import Analogs3dOsim
+from pyosim.compression import (
+    as_plain,
+    strip_compression,
+    find_file,
+    compress_file,
+    remove_scratch,
+    scratch_directory,
+)
+from pyosim.executor import Executor
+from pyosim.fileio import probe_time_range, TimeIndex, get_precision, round_file
+from pyosim.model import get_model
+from pyosim.results import ToolResults, run_trial
+from pyosim.scheduling import CostModel
+
 
 class InverseDynamics:
     """
@@ -21,9 +38,10 @@ class InverseDynamics:
     xml_forces : str
         Path to the generic forces sensor xml
     forces_dir : str
-        Path of the directory containing the forces files (`.sto`)
+        Path of the directory containing the forces files (`.sto`, or compressed `.sto.gz`, etc.)
     mot_files : str, Path, list
-        Path or list of path to the directory containing the motion files (`.mot`)
+        Path or list of path to the directory containing the
+        motion files (`.mot`, or compressed `.mot.gz`, etc.)
     sto_output : Path, str
         Output directory
     prefix : str, optional
@@ -32,6 +50,29 @@ class InverseDynamics:
         Cutoff frequency for an optional low pass filter on coordinates
     multi : bool, optional
         Launch InverseDynamics in multiprocessing if True
+    index : bool, optional
+        Write a time index next to each output file for random access (see `TimeIndex`) if True
+    compression : str, optional
+        Compress each output file with this suffix (e.g.
+        '.gz') once written (no time index is written then)
+    scratch_dir : str, optional
+        Directory where the compressed inputs and the temporary xml files are written for
+        OpenSim, each trial in its own sub-directory (system temporary directory by default)
+    digits : int, optional
+        Significant digits written in the output files (project-level `moments`
+        precision by default, resolved when the tool is created, see `set_precision`)
+    executor : Executor, optional
+        Persistent executor running the trials (shared with other tools, `multi` is ignored then)
+    cost_model : CostModel, optional
+        Run time estimates used to start the longest trials first with `multi` or
+        `executor`, updated with the run times of the trials (e.g.
+        `CostModel(history=PROJECT_PATH / '_run_times.json')`, no history by default)
+    run : bool, optional
+        Process the trials at initialization if True
+        (otherwise, call `main_loop` or the per-trial method)
+    raise_errors : bool, optional
+        Raise the error of a failing trial if True (otherwise,
+        it is stored in `results` and the other trials go on)
 
     Examples
     --------
@@ -73,7 +114,15 @@ class InverseDynamics:
             forces_dir=None,
             prefix=None,
             low_pass=None,
-            multi=False
+            multi=False,
+            index=False,
+            compression=None,
+            scratch_dir=None,
+            digits=None,
+            executor=None,
+            cost_model=None,
+            run=True,
+            raise_errors=True
     ):
         self.model_input = model_input
         self.xml_input = xml_input
@@ -83,6 +132,13 @@ class InverseDynamics:
         self.forces_dir = forces_dir
         self.low_pass = low_pass
         self.multi = multi
+        self.executor = executor
+        self.cost_model = cost_model or CostModel()
+        self.raise_errors = raise_errors
+        self.index = index
+        self.compression = compression
+        self.scratch_dir = scratch_dir
+        self.digits = digits or get_precision('moments')
 
         if prefix:
             self.prefix = prefix
@@ -95,69 +151,241 @@ class InverseDynamics:
         if not isinstance(self.mot_files[0], Path):
             self.mot_files = [Path(i) for i in self.mot_files]
 
-        self.main_loop()
+        if run:
+            self.main_loop()
 
     def main_loop(self):
-        if self.multi:
-            import os
-            from multiprocessing import Pool
-
-            pool = Pool(os.cpu_count())
-            pool.map(self.run_id_tool, self.mot_files)
+        run = partial(run_trial, self.run_id_tool, raise_errors=self.raise_errors)
+        stage = self.__class__.__name__
+        if self.executor or self.multi:
+            # longest trials first, so that a long trial does not end up alone at the end
+            files = self.cost_model.longest_first(self.mot_files, stage, model=self.model_input)
+        if self.executor:
+            trials = self.executor.map(run, files)
+        elif self.multi:
+            with Executor() as executor:
+                trials = executor.map(run, files)
         else:
-            for itrial in self.mot_files:
-                self.run_id_tool(itrial)
+            trials = [run(itrial) for itrial in self.mot_files]
+        self.cost_model.record_results(trials, stage, model=self.model_input)
+        self.cost_model.save()
+        self.results = ToolResults(stage, trials)
+        return self.results
 
     def run_id_tool(self, trial):
-        if self.prefix and not trial.stem.startswith(self.prefix):
+        if self.prefix and not strip_compression(trial).stem.startswith(self.prefix):
             # skip file if user specified a prefix and prefix is not present in current file
             pass
         else:
-            print(f'\t{trial.stem}')
-
-            # initialize inverse dynamic tool from setup file
-            model = osim.Model(self.model_input)
-            id_tool = osim.InverseDynamicsTool(self.xml_input)
-            id_tool.setModel(model)
-
-            # get starting and ending time
-            motion = osim.Storage(f'{trial.resolve()}')
-            start = motion.getFirstTime()
-            end = motion.getLastTime()
-
-            # inverse dynamics tool
-            id_tool.setStartTime(start)
-            id_tool.setEndTime(end)
-            id_tool.setCoordinatesFileName(f'{trial.resolve()}')
-
-            if self.low_pass:
-                id_tool.setLowpassCutoffFrequency(self.low_pass)
-
-            # set name of input (mot) file and output (sto)
-            filename = f'{trial.stem}'
-            id_tool.setName(filename)
-            id_tool.setOutputGenForceFileName(f"{filename}.sto")
-            id_tool.setResultsDir(f'{self.sto_output}')
-
-            # external loads file
-            if self.forces_dir:
-                loads = osim.ExternalLoads(self.xml_forces, True)
-                if self.prefix:
-                    loads.setDataFileName(
-                        f"{Path(self.forces_dir, trial.stem.replace(f'{self.prefix}_', '')).resolve()}.sto"
-                    )
-                else:
-                    loads.setDataFileName(
-                        f"{Path(self.forces_dir, trial.stem).resolve()}.sto"
+            # OpenSim needs plain files
+            # (removed with the temporary xml once the trial is processed, even if it fails)
+            motion_file = as_plain(trial, self.scratch_dir)
+            trial = strip_compression(trial)
+            scratch_files = [motion_file] if motion_file != trial else []
+            try:
+                print(f'\t{trial.stem}')
+
+                # initialize inverse dynamic tool from setup file
+                model = get_model(self.model_input, copy=True)
+                id_tool = osim.InverseDynamicsTool(self.xml_input)
+                id_tool.setModel(model)
+
+                # get starting and ending time
+                start, end = probe_time_range(motion_file)
+
+                # inverse dynamics tool
+                id_tool.setStartTime(start)
+                id_tool.setEndTime(end)
+                id_tool.setCoordinatesFileName(f'{motion_file.resolve()}')
+
+                if self.low_pass:
+                    id_tool.setLowpassCutoffFrequency(self.low_pass)
+
+                # set name of input (mot) file and output (sto)
+                filename = f'{trial.stem}'
+                id_tool.setName(filename)
+                id_tool.setOutputGenForceFileName(f"{filename}.sto")
+                id_tool.setResultsDir(f'{self.sto_output}')
+
+                # external loads file
+                if self.forces_dir:
+                    loads = osim.ExternalLoads(self.xml_forces, True)
+                    if self.prefix:
+                        forces_stem = trial.stem.replace(f'{self.prefix}_', '')
+                    else:
+                        forces_stem = trial.stem
+                    forces_file = find_file(Path(self.forces_dir, f'{forces_stem}.sto'))
+                    plain_forces_file = as_plain(forces_file, self.scratch_dir)
+                    if plain_forces_file != forces_file:
+                        scratch_files.append(plain_forces_file)
+                    loads.setDataFileName(f'{plain_forces_file.resolve()}')
+                    loads.setExternalLoadsModelKinematicsFileName(f'{motion_file.resolve()}')
+
+                    # temporary xml file, in a directory of its own as trials run concurrently
+                    temp_xml = (
+                        scratch_directory(self.scratch_dir) / f'{trial.stem}_external_loads.xml'
                     )
-                loads.setExternalLoadsModelKinematicsFileName(f'{trial.resolve()}')
+                    loads.printToXML(f'{temp_xml}')
+                    scratch_files.append(temp_xml)
+                    id_tool.setExternalLoadsFileName(f'{temp_xml}')
+
+                id_tool.printToXML(self.xml_output)
+                id_tool.run()
+            finally:
+                for ifile in scratch_files:
+                    remove_scratch(ifile)
+
+            sto_file = Path(self.sto_output) / f'{filename}.sto'
+            if self.digits:
+                round_file(sto_file, self.digits)
+            if self.compression:
+                sto_file = compress_file(sto_file, compression=self.compression)
+            elif self.index:
+                TimeIndex.build(sto_file).save()
+            return [sto_file]
+
+
+def _array_to_storage(data, time, labels):
+    """
+    Build an OpenSim Storage (data source of the external forces) from a (n_columns, n_frames) array
+    """
+    storage = osim.Storage(time.size)
+    column_labels = osim.ArrayStr()
+    for label in ['time'] + list(labels):
+        column_labels.append(label)
+    storage.setColumnLabels(column_labels)
+    for itime, row in zip(time, np.asarray(data, dtype=np.float64).T):
+        storage.append(float(itime), osim.Vector(row.tolist()))
+    return storage
+
+
+def solve_inverse_dynamics(model_input, coordinates, forces=None, xml_forces=None, sto_output=None,
+                           low_pass=None):
+    """
+    Inverse dynamic from joint angles held in memory (e.g. the
+    output of `solve_inverse_kinematics`), without reading a
+    mot file nor writing a temporary external loads xml.
+    As in the InverseDynamicsTool, the coordinates are
+    optionally low pass filtered (`Storage.lowpassIIR`)
+    then fitted with GCV splines (`osim.GCVSplineSet`),
+    from which the speeds and accelerations are computed.
+    The generalized forces are returned as an array.
+
+    Parameters
+    ----------
+    model_input : str, osim.Model
+        Path to the osim model (or loaded model, which is cloned and left untouched)
+    coordinates : Analogs3dOsim
+        Joint angles with the model coordinates names as labels (rotational coordinates in degrees)
+    forces : Analogs3dOsim, optional
+        External forces, with the columns identifiers used in `xml_forces` as labels
+    xml_forces : str, optional
+        Path to the generic forces sensor xml (required with `forces`)
+    sto_output : str, Path, optional
+        Path of a sto file to write the generalized forces in (nothing is written by default)
+    low_pass : int, optional
+        Cutoff frequency for an optional low pass filter on coordinates
+
+    Returns
+    -------
+    Analogs3dOsim
+        Generalized forces with shape (1, n_coordinates,
+        n_frames), labeled as the InverseDynamicsTool output
+
+    Examples
+    --------
+    >>> from pyosim import solve_inverse_kinematics, solve_inverse_dynamics
+    >>>
+    >>> angles = solve_inverse_kinematics('wu_scaled_markers.osim', markers, xml_input='wu_ik.xml')
+    >>> moments = solve_inverse_dynamics(
+    >>>     'wu_scaled_markers.osim',
+    >>>     angles,
+    >>>     forces=forces,
+    >>>     xml_forces='forces_sensor.xml',
+    >>>     low_pass=10,
+    >>> )
+    """
+    if forces is not None and not xml_forces:
+        raise ValueError('xml_forces is required to apply the external forces')
+
+    if isinstance(model_input, (str, Path)):
+        model = get_model(model_input, copy=True)
+    else:
+        model = model_input.clone()
+
+    # as the InverseDynamicsTool, muscles are excluded
+    force_set = model.updForceSet()
+    for iforce in range(force_set.getSize()):
+        if osim.Muscle.safeDownCast(force_set.get(iforce)):
+            force_set.get(iforce).set_appliesForce(False)
+
+    if forces is not None:
+        storage = _array_to_storage(forces[0, ...], forces.get_time_frames, forces.get_labels)
+        loads = osim.ExternalLoads(xml_forces, True)
+        for iload in range(loads.getSize()):
+            external_force = loads.get(iload).clone()
+            external_force.setDataSource(storage)
+            model.addForce(external_force)
+
+    state = model.initSystem()
+    coordinate_set = model.getCoordinateSet()
+    model_coordinates = [coordinate_set.get(icoord) for icoord in range(coordinate_set.getSize())]
+
+    # q, u and udot of each coordinate, in rad for rotational coordinates
+    time = coordinates.get_time_frames
+    labels = list(coordinates.get_labels)
+    names = [coordinate.getName() for coordinate in model_coordinates]
+    angles = np.empty((len(model_coordinates), time.size))
+    for icoord, coordinate in enumerate(model_coordinates):
+        if names[icoord] not in labels:
+            raise ValueError(f'coordinate {names[icoord]} is missing')
+        angles[icoord, :] = coordinates[0, labels.index(names[icoord]), :]
+        if coordinate.getMotionType() == osim.Coordinate.Rotational:
+            angles[icoord, :] = np.deg2rad(angles[icoord, :])
+    storage = _array_to_storage(angles, time, names)
+    if low_pass:
+        storage.pad(storage.getSize() // 2)
+        storage.lowpassIIR(low_pass)
+    splines = osim.GCVSplineSet(5, storage)
+    first_derivative, second_derivative = osim.StdVectorInt([0]), osim.StdVectorInt([0, 0])
+    q, u, udot = (np.empty_like(angles) for _ in range(3))
+    for icoord, name in enumerate(names):
+        spline = splines.get(name)
+        for iframe, itime in enumerate(time):
+            x = osim.Vector(1, float(itime))
+            q[icoord, iframe] = spline.calcValue(x)
+            u[icoord, iframe] = spline.calcDerivative(first_derivative, x)
+            udot[icoord, iframe] = spline.calcDerivative(second_derivative, x)
 
-                temp_xml = Path(f'{trial.stem}_temp.xml')
-                loads.printToXML(f'{temp_xml.resolve()}')  # temporary xml file
-                id_tool.setExternalLoadsFileName(f'{temp_xml}')
+    # mobility index of each coordinate in the state vectors
+    mobility = []
+    for coordinate in model_coordinates:
+        for other in model_coordinates:
+            other.setSpeedValue(state, 0)
+        coordinate.setSpeedValue(state, 1)
+        mobility.append(int(np.argmax(np.abs(state.getU().to_numpy()))))
 
-            id_tool.printToXML(self.xml_output)
-            id_tool.run()
+    solver = osim.InverseDynamicsSolver(model)
+    generalized_forces = np.empty((len(model_coordinates), time.size))
+    accelerations = np.zeros(state.getNU())
+    for iframe, itime in enumerate(time):
+        state.setTime(itime)
+        for icoord, coordinate in enumerate(model_coordinates):
+            coordinate.setValue(state, q[icoord, iframe], False)
+            coordinate.setSpeedValue(state, u[icoord, iframe])
+        model.realizeVelocity(state)
+        accelerations[mobility] = udot[:, iframe]
+        tau = solver.solve(state, osim.Vector(accelerations.tolist())).to_numpy()
+        generalized_forces[:, iframe] = tau[mobility]
 
-            if self.forces_dir:
-                temp_xml.unlink()  # delete temporary xml file
+    moments = Analogs3dOsim(generalized_forces[np.newaxis, ...], time_frames=time)
+    moments.get_rate = coordinates.get_rate
+    moments.get_labels = [
+        f"{coordinate.getName()}_"
+        f"{'moment' if coordinate.getMotionType() == osim.Coordinate.Rotational else 'force'}"
+        for coordinate in model_coordinates
+    ]
+    if sto_output:
+        metadata = {'header': 'Inverse Dynamics Generalized Forces', 'inDegrees': 'no'}
+        moments.to_sto(sto_output, metadata=metadata, quantity='moments')
+    return moments
@@ -1,10 +1,21 @@
 """
 Inverse kinematic class in pyosim
 """
+from functools import partial
 from pathlib import Path
 
+import numpy as np
 import opensim as osim
 
+from pyosim.analogs import Analogs3dOsim
+from pyosim.compression import as_plain, strip_compression, compress_file, remove_scratch
+from pyosim.executor import Executor
+from pyosim.fileio import probe_time_range, TimeIndex, get_precision, round_file, time_vector, UNITS
+from pyosim.model import get_model
+from pyosim.results import ToolResults, run_trial
+from pyosim.scheduling import CostModel
+from pyosim.tables import markers_array_to_table
+
 
 class InverseKinematics:
     """
@@ -19,7 +30,7 @@ class InverseKinematics:
     xml_output : str
         Output path of the ik xml
     trc_files : str, list
-        Path or list of path to the marker files (`.trc`)
+        Path or list of path to the marker files (`.trc`, or compressed `.trc.gz`, etc.)
     mot_output : str
         Output directory
     onsets : dict, optional
@@ -28,6 +39,29 @@ class InverseKinematics:
         Optional prefix to put in front of the output filename (typically model name)
     multi : bool, optional
         Launch InverseKinematics in multiprocessing if True
+    index : bool, optional
+        Write a time index next to each output file for random access (see `TimeIndex`) if True
+    compression : str, optional
+        Compress each output file with this suffix (e.g.
+        '.gz') once written (no time index is written then)
+    scratch_dir : str, optional
+        Directory where the compressed inputs and the temporary xml files are written for
+        OpenSim, each trial in its own sub-directory (system temporary directory by default)
+    digits : int, optional
+        Significant digits written in the output files (project-level `angles` precision by default,
+        resolved when the tool is created, see `set_precision`)
+    executor : Executor, optional
+        Persistent executor running the trials (shared with other tools, `multi` is ignored then)
+    cost_model : CostModel, optional
+        Run time estimates used to start the longest trials first with `multi` or
+        `executor`, updated with the run times of the trials (e.g.
+        `CostModel(history=PROJECT_PATH / '_run_times.json')`, no history by default)
+    run : bool, optional
+        Process the trials at initialization if True
+        (otherwise, call `main_loop` or the per-trial method)
+    raise_errors : bool, optional
+        Raise the error of a failing trial if True (otherwise,
+        it is stored in `results` and the other trials go on)
 
     Examples
     --------
@@ -66,7 +100,15 @@ class InverseKinematics:
             mot_output,
             onsets=None,
             prefix=None,
-            multi=False
+            multi=False,
+            index=False,
+            compression=None,
+            scratch_dir=None,
+            digits=None,
+            executor=None,
+            cost_model=None,
+            run=True,
+            raise_errors=True
     ):
         self.model_input = model_input
         self.mot_output = mot_output
@@ -74,6 +116,13 @@ class InverseKinematics:
         self.xml_input = xml_input
         self.xml_output = xml_output
         self.multi = multi
+        self.executor = executor
+        self.cost_model = cost_model or CostModel()
+        self.raise_errors = raise_errors
+        self.index = index
+        self.compression = compression
+        self.scratch_dir = scratch_dir
+        self.digits = digits or get_precision('angles')
 
         if prefix:
             self.prefix = prefix
@@ -86,51 +135,196 @@ class InverseKinematics:
         if not isinstance(self.trc_files[0], Path):
             self.trc_files = [Path(i) for i in self.trc_files]
 
-        self.main_loop()
+        if run:
+            self.main_loop()
 
     def main_loop(self):
-        if self.multi:
-            import os
-            from multiprocessing import Pool
-
-            pool = Pool(os.cpu_count())
-            pool.map(self.run_ik_tool, self.trc_files)
+        run = partial(run_trial, self.run_ik_tool, raise_errors=self.raise_errors)
+        stage = self.__class__.__name__
+        if self.executor or self.multi:
+            # longest trials first, so that a long trial does not end up alone at the end
+            files = self.cost_model.longest_first(self.trc_files, stage, model=self.model_input)
+        if self.executor:
+            trials = self.executor.map(run, files)
+        elif self.multi:
+            with Executor() as executor:
+                trials = executor.map(run, files)
         else:
-            for itrial in self.trc_files:
-                self.run_ik_tool(itrial)
+            trials = [run(itrial) for itrial in self.trc_files]
+        self.cost_model.record_results(trials, stage, model=self.model_input)
+        self.cost_model.save()
+        self.results = ToolResults(stage, trials)
+        return self.results
 
     def run_ik_tool(self, trial):
-        model = osim.Model(self.model_input)
-        # initialize inverse kinematic tool from setup file
-        ik_tool = osim.InverseKinematicsTool(self.xml_input)
-        ik_tool.setModel(model)
-
-        print(f'\t{trial.stem}')
-        # initialize inverse kinematic tool from setup file
-        ik_tool = osim.InverseKinematicsTool(self.xml_input)
-        ik_tool.setModel(model)
-
-        # set name of input (trc) file and output (mot)
-        if self.prefix:
-            filename = f"{self.prefix}_{trial.stem}"
-        else:
-            filename = trial.stem
-        ik_tool.setName(filename)
-        ik_tool.setMarkerDataFileName(f'{trial}')
-        ik_tool.setOutputMotionFileName(f"{Path(self.mot_output) / filename}.mot")
-        ik_tool.setResultsDir(self.mot_output)
-
-        if trial.stem in self.onsets:
-            # set start and end times from configuration file
-            start = self.onsets[trial.stem][0]
-            end = self.onsets[trial.stem][1]
-        else:
-            # use the trc file to get the start and end times
-            m = osim.MarkerData(f'{trial}')
-            start = m.getStartFrameTime()
-            end = m.getLastFrameTime() - 1e-2  # -1e-2 because removing last frame resolves some bug
-        ik_tool.setStartTime(start)
-        ik_tool.setEndTime(end)
-
-        ik_tool.printToXML(self.xml_output)
-        ik_tool.run()
+        # OpenSim needs a plain trc file
+        marker_file = as_plain(trial, self.scratch_dir)
+        trial = strip_compression(trial)
+        try:
+            model = get_model(self.model_input)
+            # initialize inverse kinematic tool from setup file
+            ik_tool = osim.InverseKinematicsTool(self.xml_input)
+            ik_tool.setModel(model)
+
+            print(f'\t{trial.stem}')
+            # initialize inverse kinematic tool from setup file
+            ik_tool = osim.InverseKinematicsTool(self.xml_input)
+            ik_tool.setModel(model)
+
+            # set name of input (trc) file and output (mot)
+            if self.prefix:
+                filename = f"{self.prefix}_{trial.stem}"
+            else:
+                filename = trial.stem
+            ik_tool.setName(filename)
+            ik_tool.setMarkerDataFileName(f'{marker_file}')
+            mot_file = Path(self.mot_output) / f'{filename}.mot'
+            ik_tool.setOutputMotionFileName(f'{mot_file}')
+            ik_tool.setResultsDir(self.mot_output)
+
+            if trial.stem in self.onsets:
+                # set start and end times from configuration file
+                start = self.onsets[trial.stem][0]
+                end = self.onsets[trial.stem][1]
+            else:
+                # use the trc file to get the start and end times
+                start, end = probe_time_range(marker_file)
+                end -= 1e-2  # -1e-2 because removing last frame resolves some bug
+            ik_tool.setStartTime(start)
+            ik_tool.setEndTime(end)
+
+            ik_tool.printToXML(self.xml_output)
+            ik_tool.run()
+        finally:
+            if marker_file != trial:
+                remove_scratch(marker_file)
+
+        if self.digits:
+            round_file(mot_file, self.digits)
+        if self.compression:
+            mot_file = compress_file(mot_file, compression=self.compression)
+        elif self.index:
+            TimeIndex.build(mot_file).save()
+        return [mot_file]
+
+
+def solve_inverse_kinematics(model_input, markers, xml_input=None, mot_output=None, start=None,
+                             end=None, accuracy=1e-5):
+    """
+    Inverse kinematic from a Markers3dOsim held in memory, without writing and parsing a trc file.
+    The markers reference is built in memory and the joint angles are returned as an array.
+
+    Parameters
+    ----------
+    model_input : str, osim.Model
+        Path to the osim model (or loaded model)
+    markers : Markers3dOsim
+        Markers, with `get_rate`, `get_unit` and `get_labels` filled
+    xml_input : str, optional
+        Path to the generic ik xml, used for the markers and coordinates tasks,
+        the accuracy and the constraint weight (all markers with a weight of one
+        otherwise). Coordinates tasks with values from a file are not supported
+    mot_output : str, Path, optional
+        Path of a mot file to write the joint angles in (nothing is written by default)
+    start : float, optional
+        First time to process (s)
+    end : float, optional
+        Last time to process (s)
+    accuracy : float, optional
+        Solver accuracy (overridden by `xml_input`)
+
+    Returns
+    -------
+    Analogs3dOsim
+        Joint angles with shape (1, n_coordinates, n_frames), rotational coordinates in degrees
+
+    Examples
+    --------
+    >>> from pyosim import Markers3dOsim, solve_inverse_kinematics
+    >>>
+    >>> # or from_trc, etc.
+    >>> markers = Markers3dOsim.from_c3d('trial.c3d', names=['STER', 'XIPH', 'C7'])
+    >>> markers.get_rate, markers.get_unit = 100, 'mm'
+    >>> angles = solve_inverse_kinematics('wu_scaled_markers.osim', markers, xml_input='wu_ik.xml')
+    """
+    model = get_model(model_input) if isinstance(model_input, (str, Path)) else model_input
+    state = model.initSystem()
+
+    if markers.get_unit not in UNITS:
+        raise ValueError(f'unit of the markers ({markers.get_unit}) must be one of {list(UNITS)}')
+
+    # markers in meters, as expected by the solver
+    time = time_vector(markers.shape[-1], markers.get_rate)
+    window = np.ones(time.shape, dtype=bool)
+    if start is not None:
+        window &= time >= start
+    if end is not None:
+        window &= time <= end
+    if not window.any():
+        raise ValueError(f'no frame of the markers between {start} and {end} s')
+    time = time[window]
+    data = np.asarray(markers[:-1, ...])[..., window] * UNITS[markers.get_unit]
+    table = markers_array_to_table(data, time, markers.get_labels,
+                                   metadata={'DataRate': markers.get_rate, 'Units': 'm'})
+
+    weights = osim.SetMarkerWeights()
+    coordinate_references = osim.SimTKArrayCoordinateReference()
+    constraint_weight = np.inf
+    if xml_input:
+        ik_tool = osim.InverseKinematicsTool(f'{xml_input}')
+        accuracy = ik_tool.get_accuracy()
+        constraint_weight = ik_tool.get_constraint_weight()
+        tasks = ik_tool.getIKTaskSet()
+        for itask in range(tasks.getSize()):
+            task = tasks.get(itask)
+            if not task.getApply():
+                continue
+            if osim.IKMarkerTask.safeDownCast(task):
+                weights.cloneAndAppend(osim.MarkerWeight(task.getName(), task.getWeight()))
+            elif osim.IKCoordinateTask.safeDownCast(task):
+                # as the InverseKinematicsTool, the coordinate is tracked at a constant value
+                coordinate_task = osim.IKCoordinateTask.safeDownCast(task)
+                if coordinate_task.getValueType() == osim.IKCoordinateTask.ManualValue:
+                    value = coordinate_task.getValue()
+                elif coordinate_task.getValueType() == osim.IKCoordinateTask.DefaultValue:
+                    value = model.getCoordinateSet().get(task.getName()).getDefaultValue()
+                else:
+                    raise ValueError(
+                        f'coordinate task {task.getName()}: values from a file are not supported, '
+                        f'use InverseKinematics with a trc file instead'
+                    )
+                reference = osim.CoordinateReference(task.getName(), osim.Constant(value))
+                reference.setWeight(task.getWeight())
+                coordinate_references.push_back(reference)
+    else:
+        for label in markers.get_labels:
+            weights.cloneAndAppend(osim.MarkerWeight(label, 1.0))
+
+    markers_reference = osim.MarkersReference(table, weights)
+    solver = osim.InverseKinematicsSolver(
+        model, markers_reference, coordinate_references, constraint_weight
+    )
+    solver.setAccuracy(accuracy)
+
+    coordinates = model.getCoordinateSet()
+    coordinates = [coordinates.get(icoord) for icoord in range(coordinates.getSize())]
+    angles = np.empty((len(coordinates), time.size))
+    state.setTime(time[0])
+    solver.assemble(state)
+    for iframe, itime in enumerate(time):
+        state.setTime(itime)
+        solver.track(state)
+        angles[:, iframe] = [coordinate.getValue(state) for coordinate in coordinates]
+
+    rotational = [
+        coordinate.getMotionType() == osim.Coordinate.Rotational for coordinate in coordinates
+    ]
+    angles[rotational, :] = np.rad2deg(angles[rotational, :])
+
+    angles = Analogs3dOsim(angles[np.newaxis, ...], time_frames=time)
+    angles.get_rate = markers.get_rate
+    angles.get_labels = [coordinate.getName() for coordinate in coordinates]
+    if mot_output:
+        angles.to_sto(mot_output, metadata={'header': 'Coordinates', 'inDegrees': 'yes'},
+                      quantity='angles')
+    return angles
@@ -21,7 +21,9 @@ class JointReaction(AnalyzeTool):
     ext_forces_dir : str, optional
         Path of the directory containing the external forces files (`.sto`) (Optional)
     muscle_forces_dir : str, optional
-        Path of the directory containing the muscle forces files (`.sto`) (Optional)
+        Path of the directory containing the muscle forces
+        files (`<trial>_StaticOptimization_force.sto`),
+        read by the joint reaction of each trial (Optional)
     mot_files : str, Path, list
         Path or list of path to the directory containing the motion files (`.mot`)
     sto_output : Path, str
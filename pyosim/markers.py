@@ -5,6 +5,11 @@ import opensim as osim
 
 from pyomeca import Markers
 
+from pyosim.compression import is_compressed, strip_compression, compress_file
+from pyosim.fileio import write_trc, read_trc, time_vector, get_precision
+from pyosim.model import get_marker_names
+from pyosim.tables import markers_array_to_table, table_to_markers_array
+
 
 class Markers3dOsim(Markers):
     def __new__(cls, *args, **kwargs):
@@ -17,18 +22,152 @@ class Markers3dOsim(Markers):
         if obj is None or not isinstance(obj, Markers3dOsim):
             return
 
-    def to_trc(self, filename):
+    @classmethod
+    def from_trc(cls, filename, names=None, start=None, end=None, dtype=None):
+        """
+        Read a trc file into a Markers3dOsim with a vectorized parser.
+        Only the selected markers and time window are decoded.
+
+        Parameters
+        ----------
+        filename : str, Path
+            path of the trc file
+        names : list, optional
+            markers to read (all by default)
+        start : float, optional
+            first time to read (s)
+        end : float, optional
+            last time to read (s)
+        dtype : numpy.dtype, optional
+            dtype of the markers position, e.g. `np.float32`
+            (project-level policy by default, see `set_precision`)
+
+        Returns
+        -------
+        Markers3dOsim
+        """
+        data, time, header = read_trc(filename, names=names, start=start, end=end, dtype=dtype)
+        array = np.ones((4, data.shape[1], data.shape[2]), dtype=data.dtype)
+        array[:3, ...] = data
+        markers = cls(array, time_frames=time)
+        markers.get_rate = header['rate']
+        markers.get_unit = header['unit']
+        markers.get_labels = header['labels']
+        return markers
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        Convert an OpenSim TimeSeriesTableVec3 into a Markers3dOsim in one block
+
+        Parameters
+        ----------
+        table : osim.TimeSeriesTableVec3
+            table to convert (`DataRate` and `Units` metadata are used if present)
+
+        Returns
+        -------
+        Markers3dOsim
+        """
+        data, time, labels, metadata = table_to_markers_array(table)
+        array = np.ones((4, data.shape[1], data.shape[2]))
+        array[:3, ...] = data
+        markers = cls(array, time_frames=time)
+        markers.get_labels = labels
+        if 'DataRate' in metadata:
+            markers.get_rate = float(metadata['DataRate'])
+        if 'Units' in metadata:
+            markers.get_unit = metadata['Units']
+        return markers
+
+    def to_table(self, decimals=None):
+        """
+        Convert a Markers3dOsim into an OpenSim TimeSeriesTableVec3 in one block
+
+        Parameters
+        ----------
+        decimals : int, optional
+            number of decimals kept in the markers position (full precision by default)
+
+        Returns
+        -------
+        osim.TimeSeriesTableVec3
+        """
+        data = np.asarray(self[:-1, ...])
+        if decimals is not None:
+            data = np.round(data, decimals=decimals)
+        return markers_array_to_table(
+            data,
+            time_vector(self.shape[-1], self.get_rate),
+            self.get_labels,
+            metadata={'DataRate': self.get_rate, 'Units': self.get_unit}
+        )
+
+    def prune(self, marker_set):
+        """
+        Keep only the markers used by a model
+
+        Parameters
+        ----------
+        marker_set : str, Path, list
+            path of the osim model or list of markers names
+
+        Returns
+        -------
+        tuple
+            (Markers3dOsim with the matching markers, in the
+            current order, list of the model markers missing)
+        """
+        names = get_marker_names(marker_set)
+        labels = list(self.get_labels)
+        index = [ilabel for ilabel, label in enumerate(labels) if label in names]
+        missing = sorted(set(names).difference(labels), key=names.index)
+
+        pruned = self[:, index, :]
+        pruned.get_rate = self.get_rate
+        pruned.get_unit = self.get_unit
+        pruned.get_labels = [labels[ilabel] for ilabel in index]
+        return pruned, missing
+
+    def to_trc(self, filename, use_adapter=False, digits=None, rotation=None, translation=None,
+               unit=None, marker_set=None, decimals=4, make_dirs=True):
         """
         Write a trc file from a Markers3dOsim
         Parameters
         ----------
         filename : string
-            path of the file to write
+            path of the file to write (compressed if it ends with .gz, .bz2, .xz or .zst)
+        use_adapter : bool, optional
+            Write the file with `osim.TRCFileAdapter` if True.
+            By default, the whole array is formatted in
+            one vectorized pass (same output, much faster)
+        digits : int, optional
+            significant digits written (project-level `markers`
+            precision by default, see `set_precision`).
+            Ignored by the adapter
+        rotation : numpy.ndarray, optional
+            (3, 3) rotation matrix applied to the markers position
+            while writing (e.g. lab Z-up to OpenSim Y-up).
+            Not available with the adapter
+        translation : numpy.ndarray, optional
+            translation added after the rotation, in the
+            written unit. Not available with the adapter
+        unit : str, optional
+            unit written (e.g. "m"), the markers position being scaled from `get_unit` while writing
+            (`get_unit` by default). Not available with the adapter
+        marker_set : str, Path, list, optional
+            path of an osim model or list of markers names: only the matching markers are written
+            and the missing ones are reported
+        decimals : int, optional
+            decimals kept in the markers position, in `get_unit`
+            (scaled with the written unit). None to keep them all
+        make_dirs : bool, optional
+            create the directory of `filename` if it does not exist
+            (False to skip the check when the caller already created it, e.g. `batch_export`)
         """
         filename = Path(filename)
-        # Make sure the directory exists, otherwise create it
-        if not filename.parents[0].is_dir():
-            filename.parents[0].mkdir()
+        if make_dirs:
+            filename.parent.mkdir(parents=True, exist_ok=True)
 
         # Make sure the metadata are set
         if not self.get_rate:
@@ -39,21 +178,47 @@ class Markers3dOsim(Markers):
             raise ValueError(
                 'get_labels is empty. Please fill with `your_variable.get_labels = ["M1", "M2"]` for example')
 
-        table = osim.TimeSeriesTableVec3()
-
-        # set metadata
-        table.setColumnLabels(self.get_labels)
-        table.addTableMetaDataString('DataRate', str(self.get_rate))
-        table.addTableMetaDataString('Units', self.get_unit)
-
-        time_vector = np.arange(start=0, stop=1 / self.get_rate * self.shape[2], step=1 / self.get_rate)
+        if marker_set is not None:
+            markers, missing = self.prune(marker_set)
+            if missing:
+                print(f'\t{filename.name}: model markers missing {missing}')
+            return markers.to_trc(filename, use_adapter=use_adapter, digits=digits,
+                                  rotation=rotation, translation=translation, unit=unit,
+                                  decimals=decimals, make_dirs=False)
 
-        for iframe in range(self.shape[-1]):
-            a = np.round(self.get_frame(iframe)[:-1, ...], decimals=4)
-            row = osim.RowVectorOfVec3(
-                [osim.Vec3(a[0, i], a[1, i], a[2, i]) for i in range(a.shape[-1])]
+        if use_adapter:
+            if rotation is not None or translation is not None or unit:
+                raise ValueError(
+                    'rotation, translation and unit are not available with the adapter'
+                )
+            self._to_trc_adapter(filename, decimals=decimals)
+        else:
+            write_trc(
+                filename,
+                self[:-1, ...],
+                labels=self.get_labels,
+                rate=self.get_rate,
+                unit=self.get_unit,
+                decimals=decimals,
+                digits=digits or get_precision('markers'),
+                rotation=rotation,
+                translation=translation,
+                output_unit=unit
             )
-            table.appendRow(time_vector[iframe], row)
+
+    def _to_trc_adapter(self, filename, decimals=4):
+        """
+        Write a trc file from a Markers3dOsim with `osim.TRCFileAdapter`
+        Parameters
+        ----------
+        filename : Path
+            path of the file to write
+        """
+        table = self.to_table(decimals=decimals)
 
         adapter = osim.TRCFileAdapter()
-        adapter.write(table, str(filename))
+        if is_compressed(filename):
+            adapter.write(table, str(strip_compression(filename)))
+            compress_file(strip_compression(filename), output=filename)
+        else:
+            adapter.write(table, str(filename))
@@ -1,9 +1,59 @@
 """
 Model class in pyosim
 """
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from xml.etree import ElementTree
+
 import opensim as osim
 
 
+def get_marker_names(marker_set):
+    """
+    Get the markers names of a model, read from the
+    MarkerSet of the osim file without loading the model
+
+    Parameters
+    ----------
+    marker_set : str, Path, list
+        Path of an osim model, or list of markers names (returned as is)
+
+    Returns
+    -------
+    list
+    """
+    if isinstance(marker_set, (str, Path)):
+        root = ElementTree.parse(f'{marker_set}').getroot()
+        return [marker.get('name') for marker in root.iterfind('.//MarkerSet/objects/Marker')]
+    return list(marker_set)
+
+
+def get_muscle_count(filename):
+    """
+    Get the number of muscles of a model, read from the ForceSet of the osim file without
+    loading the model (cached by path and modification time, an edited model file is read again)
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the osim model
+
+    Returns
+    -------
+    int
+    """
+    filename = Path(filename).resolve()
+    return _count_muscles(f'{filename}', filename.stat().st_mtime_ns)
+
+
+@lru_cache()
+def _count_muscles(filename, mtime_ns):
+    """Number of muscles of an osim file, `mtime_ns` being only part of the cache key"""
+    root = ElementTree.parse(filename).getroot()
+    return sum('Muscle' in force.tag for force in root.iterfind('.//ForceSet/objects/*'))
+
+
 class Model(osim.Model):
     """Wrapper around opensim's osim models."""
 
@@ -25,3 +75,113 @@ class Model(osim.Model):
             current_muscle.setMaxIsometricForce(current_muscle.getMaxIsometricForce() * factor)
         new_model.printToXML(output)
         print(f'{output} created')
+
+
+class ModelCache:
+    """
+    LRU cache of loaded and initialized osim models, keyed by path and modification time
+    (an edited model file is reloaded)
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of models kept
+    """
+
+    def __init__(self, maxsize=4):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._models = OrderedDict()
+
+    def get(self, filename, copy=False):
+        """
+        Get a model, loaded and initialized on the first call only
+
+        Parameters
+        ----------
+        filename : str, Path
+            Path of the osim model
+        copy : bool, optional
+            Return a copy of the cached model if True (for callers adding components to the model).
+            The copy is not initialized: only the parsing of the osim file is spared,
+            `initSystem` is left to the caller
+
+        Returns
+        -------
+        osim.Model
+        """
+        filename = Path(filename).resolve()
+        key = (f'{filename}', filename.stat().st_mtime_ns)
+        if key in self._models:
+            self.hits += 1
+            self._models.move_to_end(key)
+        else:
+            self.misses += 1
+            model = osim.Model(key[0])
+            model.initSystem()
+            self._models[key] = model
+            if len(self._models) > self.maxsize:
+                self._models.popitem(last=False)
+        return self._models[key].clone() if copy else self._models[key]
+
+    def info(self):
+        """Cache statistics: `hits`, `misses`, `size` and `maxsize`"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._models),
+            'maxsize': self.maxsize,
+        }
+
+    def clear(self):
+        """Remove all the models and reset the counters"""
+        self._models.clear()
+        self.hits = self.misses = 0
+
+
+# one cache per process (each pool worker has its own)
+_MODEL_CACHE = ModelCache()
+
+
+def init_model_cache(maxsize=4):
+    """
+    Set up the model cache of the current process, typically used as a pool initializer
+    (`Pool(initializer=init_model_cache)`)
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of models kept
+    """
+    global _MODEL_CACHE
+    _MODEL_CACHE = ModelCache(maxsize)
+
+
+def get_model(filename, copy=False):
+    """
+    Get a model from the cache of the current process (see `ModelCache.get`)
+
+    Parameters
+    ----------
+    filename : str, Path
+        Path of the osim model
+    copy : bool, optional
+        Return a copy of the cached model if True (for callers adding components to the model).
+        The copy is not initialized: only the parsing of the osim file is spared,
+        `initSystem` is left to the caller
+
+    Returns
+    -------
+    osim.Model
+    """
+    return _MODEL_CACHE.get(filename, copy=copy)
+
+
+def model_cache_info():
+    """
+    Model cache statistics of the current process: `hits`, `misses`, `size` and `maxsize`.
+    A hit with `copy=True` returns an uninitialized
+    clone: it only spares the parsing of the osim file
+    """
+    return _MODEL_CACHE.info()
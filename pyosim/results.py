@@ -0,0 +1,216 @@
+"""
+Result handles returned by the pyosim tools
+"""
+import time
+import traceback
+from pathlib import Path
+
+import pandas as pd
+
+from pyosim.analogs import Analogs3dOsim
+from pyosim.compression import strip_compression
+from pyosim.model import model_cache_info
+
+
+class TrialResult:
+    """
+    Outputs, timing and status of one trial processed by a pyosim tool
+
+    Parameters
+    ----------
+    trial : Path
+        Input file of the trial
+    outputs : list, optional
+        Output files written for the trial
+    seconds : float, optional
+        Processing time (s)
+    status : str, optional
+        'done', 'skipped' or 'failed'
+    error : str, optional
+        Traceback of the error if the trial failed
+    cache : dict, optional
+        Model cache `hits` and `misses` of the process that ran the trial, during the trial
+    """
+
+    def __init__(self, trial, outputs=None, seconds=0.0, status='done', error=None, cache=None):
+        self.trial = Path(trial)
+        self.outputs = [Path(ifile) for ifile in outputs or []]
+        self.seconds = seconds
+        self.status = status
+        self.error = error
+        self.cache = cache or {'hits': 0, 'misses': 0}
+
+    def __repr__(self):
+        return (
+            f'TrialResult({self.name}, status={self.status}, outputs={len(self.outputs)}, '
+            f'seconds={self.seconds:.2f})'
+        )
+
+    @property
+    def name(self):
+        """Name of the trial (stem of the input file)"""
+        return strip_compression(self.trial).stem
+
+    def get_output(self, contains=None):
+        """
+        Get the output file of the trial
+
+        Parameters
+        ----------
+        contains : str, optional
+            String contained in the output filename (e.g. 'StaticOptimization_force'),
+            required if the trial has several outputs
+
+        Returns
+        -------
+        Path
+        """
+        outputs = [ifile for ifile in self.outputs if not contains or contains in ifile.name]
+        if len(outputs) != 1:
+            raise ValueError(
+                f'{len(outputs)} outputs of {self.name} match {contains}: '
+                f'{[i.name for i in outputs]}'
+            )
+        return outputs[0]
+
+    def load(self, contains=None, **kwargs):
+        """
+        Read an output file of the trial, on demand
+
+        Parameters
+        ----------
+        contains : str, optional
+            String contained in the output filename, required if the trial has several outputs
+        kwargs
+            Keyword arguments passed to `Analogs3dOsim.from_sto` (e.g. `names`, `start`, `end`)
+
+        Returns
+        -------
+        Analogs3dOsim
+        """
+        return Analogs3dOsim.from_sto(self.get_output(contains), **kwargs)
+
+
+class ToolResults:
+    """
+    Results of a pyosim tool run (e.g. `InverseKinematics(...).results`)
+
+    Parameters
+    ----------
+    tool : str
+        Name of the tool
+    trials : list
+        List of TrialResult
+
+    Examples
+    --------
+    >>> from pyosim import InverseKinematics, InverseDynamics
+    >>>
+    >>> ik = InverseKinematics(...)
+    >>> print(ik.results.to_dataframe())
+    >>> print(ik.results.cache_info)  # models loaded (misses) and reused (hits) by the workers
+    >>> angles = ik.results['IRSST_DapOd0'].load(names=['elv_angle'])
+    >>> idyn = InverseDynamics(..., mot_files=ik.results.outputs)
+    """
+
+    def __init__(self, tool, trials):
+        self.tool = tool
+        self.trials = list(trials)
+
+    def __repr__(self):
+        return f'ToolResults({self.tool}, trials={len(self)}, failed={len(self.failed)})'
+
+    def __len__(self):
+        return len(self.trials)
+
+    def __iter__(self):
+        return iter(self.trials)
+
+    def __getitem__(self, name):
+        for itrial in self.trials:
+            if itrial.name == name:
+                return itrial
+        raise KeyError(f'{name} was not processed by {self.tool}')
+
+    @property
+    def outputs(self):
+        """Output files of all the trials"""
+        return [ifile for itrial in self.trials for ifile in itrial.outputs]
+
+    @property
+    def failed(self):
+        """Trials that failed"""
+        return [itrial for itrial in self.trials if itrial.status == 'failed']
+
+    @property
+    def cache_info(self):
+        """
+        Model cache `hits` and `misses` summed over the trials (i.e. over all the worker processes)
+        """
+        return {key: sum(itrial.cache[key] for itrial in self.trials) for key in ('hits', 'misses')}
+
+    def to_dataframe(self):
+        """
+        Summary of the run
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per trial with the `status`, `seconds` and `outputs` columns
+        """
+        return pd.DataFrame(
+            [
+                {
+                    'trial': itrial.name,
+                    'status': itrial.status,
+                    'seconds': itrial.seconds,
+                    'outputs': [f'{ifile}' for ifile in itrial.outputs],
+                }
+                for itrial in self.trials
+            ],
+            columns=['trial', 'status', 'seconds', 'outputs'],
+        )
+
+
+def run_trial(function, trial, raise_errors=False, **kwargs):
+    """
+    Run a tool on a trial and wrap its outputs into a TrialResult.
+    Unless `raise_errors`, an error does not stop the
+    other trials: it is printed and stored in the result.
+
+    Parameters
+    ----------
+    function : callable
+        Tool function called with the trial, returning the
+        list of outputs (None if the trial is skipped)
+    trial : Path
+        Input file of the trial
+    raise_errors : bool, optional
+        Let the error of the trial propagate if True
+    kwargs
+        Per-trial keyword arguments passed to `function` (e.g. `forces_file`)
+
+    Returns
+    -------
+    TrialResult
+    """
+    tic = time.perf_counter()
+    before = model_cache_info()
+    try:
+        outputs = function(trial, **kwargs)
+    except Exception:
+        if raise_errors:
+            raise
+        error = traceback.format_exc()
+        print(f'\t{Path(trial).name} failed:\n{error}')
+        return TrialResult(trial, seconds=time.perf_counter() - tic, status='failed', error=error,
+                           cache=_cache_delta(before))
+    status = 'skipped' if outputs is None else 'done'
+    return TrialResult(trial, outputs, seconds=time.perf_counter() - tic, status=status,
+                       cache=_cache_delta(before))
+
+
+def _cache_delta(before):
+    """Model cache hits and misses of the current process since `before`"""
+    after = model_cache_info()
+    return {key: after[key] - before[key] for key in ('hits', 'misses')}
@@ -4,6 +4,9 @@ Scale class in pyosim
 
 import opensim as osim
 
+from pyosim.compression import as_plain, remove_scratch
+from pyosim.fileio import probe_time_range
+
 
 class Scale:
     """
@@ -20,7 +23,7 @@ class Scale:
     xml_output : str
         Output path of the scaling xml
     static_path : str
-        Path to the static trial (must be .trc)
+        Path to the static trial (must be .trc, or compressed .trc.gz, etc.)
     mass : double
         Participant's mass (kg)
     height : double
@@ -85,30 +88,34 @@ class Scale:
         self.model = osim.Model(model_input)
         self.model_output = model_output
         self.model_with_markers_output = model_output.replace(".osim", "_markers.osim")
-        self.static_path = static_path
+        # OpenSim needs a plain trc file (removed once the model is scaled, even if it fails)
+        self.static_input = f"{static_path}"
+        self.static_path = f"{as_plain(static_path)}"
         self.xml_output = xml_output
 
-        self.time_range = self.time_range_from_static()
+        try:
+            self.time_range = self.time_range_from_static()
 
-        # initialize scale tool from setup file
-        self.scale_tool = osim.ScaleTool(xml_input)
-        self.set_anthropometry(mass, height, age)
-        # Tell scale tool to use the loaded model
-        self.scale_tool.getGenericModelMaker().setModelFileName(model_input)
+            # initialize scale tool from setup file
+            self.scale_tool = osim.ScaleTool(xml_input)
+            self.set_anthropometry(mass, height, age)
+            # Tell scale tool to use the loaded model
+            self.scale_tool.getGenericModelMaker().setModelFileName(model_input)
 
-        self.run_model_scaler(mass)
-        self.run_marker_placer()
+            self.run_model_scaler(mass)
+            self.run_marker_placer()
 
-        if add_model:
-            self.combine_models(add_model)
+            if add_model:
+                self.combine_models(add_model)
 
-        if not remove_unused:
-            self.add_unused_markers()
+            if not remove_unused:
+                self.add_unused_markers()
+        finally:
+            if self.static_path != self.static_input:
+                remove_scratch(self.static_path)
 
     def time_range_from_static(self):
-        static = osim.MarkerData(self.static_path)
-        initial_time = static.getStartFrameTime()
-        final_time = static.getLastFrameTime()
+        initial_time, final_time = probe_time_range(self.static_path)
         range_time = osim.ArrayDouble()
         range_time.set(0, initial_time)
         range_time.set(1, final_time)
@@ -175,7 +182,10 @@ class Scale:
         # save processed model
         scaled_model.printToXML(self.model_output)
 
-        # print scale config to xml
+        # print scale config to xml, with the static trial
+        # given by the user rather than its scratch copy
+        self.scale_tool.getModelScaler().setMarkerFileName(self.static_input)
+        marker_placer.setStaticPoseFileName(self.static_input)
         self.scale_tool.printToXML(self.xml_output)
 
     def add_unused_markers(self):
@@ -0,0 +1,213 @@
+"""
+Cost-aware scheduling in pyosim.
+Trials are run longest first, the cost being estimated from the number of frames, the
+model size and the stage, and refined from a local history of measured run times.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+
+from pyosim.fileio import count_frames
+from pyosim.model import get_muscle_count
+
+# relative cost of one frame per stage, before any measured run time
+STAGE_FACTORS = {
+    'InverseKinematics': 1.0,
+    'InverseDynamics': 0.2,
+    'StaticOptimization': 5.0,
+    'MuscleAnalysis': 2.0,
+    'JointReaction': 3.0,
+}
+
+# stages whose cost grows with the number of muscles of the model
+MUSCLE_STAGES = ('StaticOptimization', 'MuscleAnalysis', 'JointReaction')
+
+# number of run times kept per stage (the most recent ones)
+HISTORY_SIZE = 200
+
+
+class CostModel:
+    """
+    Run time estimate of a trial.
+    Before any measured run time, the estimate of a stage is `factor[stage]
+    * work`, the work being the number of frames, times (1 + number of
+    muscles) for the stages computing muscle forces (see `work`).
+    Once run times are recorded for a stage, its estimate is `intercept + slope
+    * work`, fitted on the measured run times, and a trial already run is
+    estimated from its own measured run time (scaled by its change of work).
+
+    Parameters
+    ----------
+    history : str, Path, optional
+        Json file where the measured run times are kept
+        between sessions (no history kept by default)
+    factors : dict, optional
+        Cost of one frame per stage (`STAGE_FACTORS` by default)
+
+    Examples
+    --------
+    >>> from pyosim import CostModel
+    >>>
+    >>> cost_model = CostModel(history=PROJECT_PATH / '_run_times.json')
+    >>> trials = cost_model.longest_first(trials, 'StaticOptimization', model=model_path)
+    """
+
+    def __init__(self, history=None, factors=None):
+        self.history = Path(history) if history else None
+        self.factors = dict(STAGE_FACTORS, **(factors or {}))
+        self.records = {}
+        if self.history and self.history.is_file():
+            with open(self.history) as file:
+                # the stages of older histories (lists of
+                # seconds per unit of work) are measured again
+                self.records = {stage: records for stage, records in json.load(file).items()
+                                if isinstance(records, dict)}
+
+    @staticmethod
+    def work(filename, stage, model=None):
+        """
+        Amount of work of a trial: number of frames, times
+        (1 + number of muscles) for the `MUSCLE_STAGES`
+
+        Parameters
+        ----------
+        filename : str, Path
+            Input file of the trial
+        stage : str
+            Tool name (e.g. 'InverseKinematics')
+        model : str, Path, optional
+            Path of the osim model
+
+        Returns
+        -------
+        float
+        """
+        try:
+            n_frames = count_frames(filename)
+        except (OSError, ValueError, KeyError):
+            # unreadable header: the trial is not prioritized
+            n_frames = 1
+        if stage in MUSCLE_STAGES and isinstance(model, (str, Path)):
+            return float(n_frames * (1 + get_muscle_count(model)))
+        return float(n_frames)
+
+    def fit(self, stage):
+        """
+        Cost of a stage as a function of the work, fitted on the recorded run times
+
+        Parameters
+        ----------
+        stage : str
+            Tool name
+
+        Returns
+        -------
+        tuple
+            (intercept, slope), `(0, factor[stage])` if no run time was recorded
+        """
+        runs = np.array(self.records.get(stage, {}).get('runs', []), dtype=float).reshape(-1, 2)
+        if not runs.size:
+            return 0.0, self.factors.get(stage, 1.0)
+        work, seconds = runs.T
+        if np.unique(work).size < 2:
+            # a single amount of work: no intercept can be told apart
+            return 0.0, float(np.median(seconds / work))
+        slope, intercept = np.polyfit(work, seconds, 1)
+        if slope <= 0:
+            # noisy run times: fall back to a cost proportional to the work
+            return 0.0, float(np.median(seconds / work))
+        return float(intercept), float(slope)
+
+    def estimate(self, filename, stage, model=None):
+        """
+        Estimated cost of a trial
+
+        Parameters
+        ----------
+        filename : str, Path
+            Input file of the trial
+        stage : str
+            Tool name (e.g. 'InverseKinematics')
+        model : str, Path, optional
+            Path of the osim model
+
+        Returns
+        -------
+        float
+        """
+        work = self.work(filename, stage, model)
+        measured = self.records.get(stage, {}).get('trials', {}).get(self._key(filename))
+        if measured:
+            measured_work, seconds = measured
+            return seconds * work / measured_work
+        intercept, slope = self.fit(stage)
+        return intercept + slope * work
+
+    def record(self, filename, stage, seconds, model=None):
+        """
+        Record the measured run time of a trial
+
+        Parameters
+        ----------
+        filename : str, Path
+            Input file of the trial
+        stage : str
+            Tool name
+        seconds : float
+            Measured run time
+        model : str, Path, optional
+            Path of the osim model
+        """
+        work = self.work(filename, stage, model)
+        records = self.records.setdefault(stage, {'runs': [], 'trials': {}})
+        records['runs'].append([work, seconds])
+        del records['runs'][:-HISTORY_SIZE]
+        records['trials'][self._key(filename)] = [work, seconds]
+
+    def record_results(self, trials, stage, model=None):
+        """
+        Record the measured run times of the trials done by a tool
+
+        Parameters
+        ----------
+        trials : list
+            TrialResult of each trial
+        stage : str
+            Tool name
+        model : str, Path, optional
+            Path of the osim model
+        """
+        for itrial in trials:
+            if itrial.status == 'done':
+                self.record(itrial.trial, stage, itrial.seconds, model)
+
+    def save(self):
+        """Write the recorded run times in the history file"""
+        if self.history:
+            with open(self.history, 'w') as file:
+                json.dump(self.records, file)
+
+    def longest_first(self, files, stage, model=None):
+        """
+        Sort trials by decreasing estimated cost
+
+        Parameters
+        ----------
+        files : list
+            Input files of the trials
+        stage : str
+            Tool name
+        model : str, Path, optional
+            Path of the osim model
+
+        Returns
+        -------
+        list
+        """
+        return sorted(files, key=lambda ifile: self.estimate(ifile, stage, model), reverse=True)
+
+    @staticmethod
+    def _key(filename):
+        """History key of a trial (its absolute path)"""
+        return f'{Path(filename).resolve()}'
@@ -0,0 +1,113 @@
+"""
+Bulk conversion between numpy arrays and OpenSim's TimeSeriesTable in pyosim.
+The whole matrix crosses the python/C++ boundary at once instead of one row per frame.
+"""
+import numpy as np
+import opensim as osim
+
+# suffixes of the x, y and z columns when packing/flattening a TimeSeriesTableVec3
+VEC3_SUFFIXES = ['_x', '_y', '_z']
+
+
+def array_to_table(data, time, labels, metadata=None):
+    """
+    Build a TimeSeriesTable from a whole matrix
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Data with shape (n_columns, n_frames)
+    time : numpy.ndarray
+        Time vector
+    labels : list
+        Columns labels
+    metadata : dict, optional
+        Table metadata (values are converted to str)
+
+    Returns
+    -------
+    osim.TimeSeriesTable
+    """
+    if data.shape[0] != len(labels):
+        raise ValueError(f'{len(labels)} labels for {data.shape[0]} columns')
+    matrix = osim.Matrix.createFromMat(np.ascontiguousarray(data.T, dtype=np.float64))
+    table = osim.TimeSeriesTable(
+        osim.StdVectorDouble(np.asarray(time, dtype=np.float64).tolist()),
+        matrix,
+        osim.StdVectorString(list(labels))
+    )
+    if metadata:
+        for key, value in metadata.items():
+            table.addTableMetaDataString(key, str(value))
+    return table
+
+
+def table_to_array(table):
+    """
+    Convert a TimeSeriesTable into numpy arrays
+
+    Parameters
+    ----------
+    table : osim.TimeSeriesTable
+        Table to convert
+
+    Returns
+    -------
+    tuple
+        (data with shape (n_columns, n_frames), time vector, labels, metadata)
+    """
+    data = table.getMatrix().to_numpy().T
+    time = np.array(list(table.getIndependentColumn()))
+    labels = list(table.getColumnLabels())
+    metadata = {key: table.getTableMetaDataAsString(key) for key in table.getTableMetaDataKeys()}
+    return data, time, labels, metadata
+
+
+def markers_array_to_table(data, time, labels, metadata=None):
+    """
+    Build a TimeSeriesTableVec3 from a whole markers array
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Markers position with shape (3, n_markers, n_frames)
+    time : numpy.ndarray
+        Time vector
+    labels : list
+        Markers labels
+    metadata : dict, optional
+        Table metadata (e.g. `DataRate` and `Units`)
+
+    Returns
+    -------
+    osim.TimeSeriesTableVec3
+    """
+    # (3, n_markers, n_frames) -> (n_markers * [x, y, z], n_frames)
+    flat = data[:3, ...].transpose(1, 0, 2).reshape(-1, data.shape[-1])
+    flat_labels = [f'{label}{suffix}' for label in labels for suffix in VEC3_SUFFIXES]
+    table = array_to_table(flat, time, flat_labels).packVec3(osim.StdVectorString(VEC3_SUFFIXES))
+    if metadata:
+        for key, value in metadata.items():
+            table.addTableMetaDataString(key, str(value))
+    return table
+
+
+def table_to_markers_array(table):
+    """
+    Convert a TimeSeriesTableVec3 into numpy arrays
+
+    Parameters
+    ----------
+    table : osim.TimeSeriesTableVec3
+        Table to convert
+
+    Returns
+    -------
+    tuple
+        (markers position with shape (3, n_markers, n_frames), time vector, labels, metadata)
+    """
+    labels = list(table.getColumnLabels())
+    metadata = {key: table.getTableMetaDataAsString(key) for key in table.getTableMetaDataKeys()}
+    flat, time, _, _ = table_to_array(table.flatten(osim.StdVectorString(VEC3_SUFFIXES)))
+    data = flat.reshape(len(labels), 3, -1).transpose(1, 0, 2)
+    return data, time, labels, metadata
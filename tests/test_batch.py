@@ -0,0 +1,37 @@
+from pathlib import Path
+
+import numpy as np
+
+from pyosim.batch import batch_prune_trc
+from pyosim.fileio import read_trc, write_trc, probe_time_range
+
+MARKERS_TRC = Path(__file__).parent / 'data' / 'markers.trc'
+
+
+def test_prune_keeps_values(tmp_path):
+    # positions in metres, with sub-0.1 mm precision
+    data = np.round(np.random.RandomState(0).randn(3, 4, 200), 7)
+    filename = tmp_path / 'trial.trc'
+    write_trc(filename, data, ['M1', 'M2', 'M3', 'M4'], 100.0, 'm', decimals=None,
+              time=np.arange(200) / 100.0 + 1.0, frames=np.arange(101, 301))
+
+    report = batch_prune_trc([filename], ['M3', 'M1', 'M5'])
+    assert report.loc[0, 'kept'] == 2
+    assert report.loc[0, 'removed'] == 2
+    assert report.loc[0, 'missing'] == ['M5']
+
+    pruned, time, header = read_trc(filename, exact=True)
+    assert header['labels'] == ['M1', 'M3']
+    np.testing.assert_array_equal(pruned, data[:, [0, 2], :])
+    np.testing.assert_array_equal(header['frames'], np.arange(101, 301))
+    assert probe_time_range(filename) == (1.0, 2.99)
+
+
+def test_prune_keeps_fixture_values(tmp_path):
+    names = ['boite:droite_int', 'boite:gauche_ext']
+    expected, _, _ = read_trc(MARKERS_TRC, names=names, exact=True)
+
+    batch_prune_trc([MARKERS_TRC], names, output_dir=tmp_path)
+    pruned, _, header = read_trc(tmp_path / MARKERS_TRC.name, exact=True)
+    assert header['labels'] == ['boite:gauche_ext', 'boite:droite_int']
+    np.testing.assert_array_equal(pruned, expected[:, ::-1, :])
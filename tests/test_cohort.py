@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import pytest
+
+from pyosim.cohort import PipelineRunner
+from pyosim.inverse_dynamics import InverseDynamics
+from pyosim.inverse_kinematics import InverseKinematics
+from pyosim.joint_reaction import JointReaction
+from pyosim.muscle_analysis import MuscleAnalysis
+from pyosim.static_optimization import StaticOptimization
+
+
+class Conf:
+    def __init__(self, project_path):
+        self.project_path = Path(project_path)
+
+
+# a -> b -> c, a -> d -> e
+A, B, C, D, E = (type(name, (), {}) for name in 'ABCDE')
+
+
+DEPENDENCIES = {A: [], B: [A], C: [B], D: [A], E: [D]}
+
+
+def runner(tmp_path, stages, dependencies=None):
+    return PipelineRunner(Conf(tmp_path), [(tool, None) for tool in stages], participants=['p1'],
+                          dependencies=dependencies)
+
+
+@pytest.mark.parametrize('stages,needs', [
+    ([InverseKinematics, StaticOptimization, JointReaction], [StaticOptimization]),
+    ([InverseKinematics, JointReaction], [InverseKinematics]),
+    ([InverseKinematics, InverseDynamics, MuscleAnalysis, JointReaction], [InverseKinematics]),
+    ([JointReaction], []),
+])
+def test_needs_walks_missing_stages(tmp_path, stages, needs):
+    assert runner(tmp_path, stages)._needs(JointReaction) == needs
+
+
+def test_needs_transitive(tmp_path):
+    pipeline = runner(tmp_path, [A, C, E], dependencies=DEPENDENCIES)
+    assert pipeline._needs(A) == []
+    assert pipeline._needs(C) == [A]
+    assert pipeline._needs(E) == [A]
+
+    pipeline = runner(tmp_path, [A, B, C, D, E], dependencies=DEPENDENCIES)
+    assert pipeline._needs(C) == [B]
+    assert pipeline._needs(E) == [D]
+
+
+def test_needs_without_duplicates(tmp_path):
+    dependencies = {A: [], B: [A], C: [A], D: [B, C]}
+    assert runner(tmp_path, [A, D], dependencies=dependencies)._needs(D) == [A]
+
+
+def test_skip_children_of_failed_trial(tmp_path):
+    pipeline = runner(tmp_path, [A, B, C, D, E], dependencies=DEPENDENCIES)
+    lineage = ('p1', Path('trial.trc'))
+    sources = {lineage: lineage[1]}
+    done = {lineage: {A: 'done', B: 'failed'}}
+    trials = {}
+
+    pipeline._skip(C, 'p1', lineage, sources, done, trials)
+    assert done[lineage] == {A: 'done', B: 'failed', C: 'skipped'}
+    assert [itrial.status for itrial in trials[('p1', 'C')]] == ['skipped']
+
+    # the whole branch below a failed stage is skipped, the other branch is left to run
+    done = {lineage: {A: 'failed'}}
+    trials = {}
+    pipeline._skip(B, 'p1', lineage, sources, done, trials)
+    assert done[lineage] == {A: 'failed', B: 'skipped', C: 'skipped'}
+    assert sorted(trials) == [('p1', 'B'), ('p1', 'C')]
+    assert trials[('p1', 'C')][0].name == 'trial'
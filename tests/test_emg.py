@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from pyosim.analogs import Analogs3dOsim
+from pyosim.emg import emg_envelope, mvc_maxima, read_emg
+from pyosim.fileio import write_sto
+
+RATE = 2000.0
+LABELS = ['deltoid', 'biceps']
+
+
+def modulated_sine(amplitudes, seconds=4.0, carrier=100.0):
+    """Sinusoids at `carrier` Hz whose amplitude `amplitudes[i] * (1 + 0.5 sin(pi t))` varies slowly"""
+    time = np.arange(int(seconds * RATE)) / RATE
+    amplitude = np.outer(amplitudes, 1 + 0.5 * np.sin(np.pi * time))
+    return time, amplitude, amplitude * np.sin(2 * np.pi * carrier * time)
+
+
+def to_analogs(data):
+    emg = Analogs3dOsim(data[np.newaxis, ...])
+    emg.get_rate = RATE
+    emg.get_labels = LABELS
+    return emg
+
+
+@pytest.mark.parametrize('band_pass', [(10, 425), None])
+def test_envelope_of_sine(band_pass):
+    _, amplitude, data = modulated_sine([1.0, 3.0])
+    envelope = emg_envelope(to_analogs(data), band_pass=band_pass, low_pass=5)
+
+    assert envelope.shape == (1, 2, data.shape[-1])
+    assert envelope.get_rate == RATE
+    assert list(envelope.get_labels) == LABELS
+    # mean of a rectified sinusoid: 2 / pi of its amplitude (the edges are left out of the filters transients)
+    middle = slice(int(0.5 * RATE), int(3.5 * RATE))
+    np.testing.assert_allclose(envelope[0][:, middle], 2 / np.pi * amplitude[:, middle], rtol=0.02)
+
+
+def test_envelope_needs_rate():
+    emg = to_analogs(np.zeros((2, 100)))
+    emg.get_rate = None
+    with pytest.raises(ValueError):
+        emg_envelope(emg)
+
+
+def test_mvc_maxima_streaming(tmp_path):
+    files = []
+    for i, amplitudes in enumerate([[1.0, 4.0], [2.0, 1.0], [0.5, 2.0]]):
+        time, _, data = modulated_sine(amplitudes, seconds=2.0 + i)
+        files.append(tmp_path / f'mvc{i}.sto')
+        write_sto(files[-1], data, LABELS, RATE, time=time)
+
+    maxima = mvc_maxima(files)
+    assert list(maxima.index) == LABELS
+
+    # all the envelopes in memory at once
+    envelopes = np.concatenate([np.asarray(emg_envelope(read_emg(ifile))[0]) for ifile in files], axis=-1)
+    np.testing.assert_allclose(maxima.values, envelopes.max(axis=-1))
+    np.testing.assert_allclose(mvc_maxima(files, names=['biceps']).values, envelopes[1:].max(axis=-1))
+
+
+def test_mvc_maxima_errors(tmp_path):
+    time, _, data = modulated_sine([1.0, 2.0])
+    write_sto(tmp_path / 'mvc0.sto', data, LABELS, RATE, time=time)
+    write_sto(tmp_path / 'mvc1.sto', data, LABELS[::-1], RATE, time=time)
+
+    with pytest.raises(ValueError):
+        mvc_maxima([tmp_path / 'mvc0.sto', tmp_path / 'mvc1.sto'])
+    with pytest.raises(ValueError):
+        mvc_maxima([])
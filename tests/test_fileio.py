@@ -0,0 +1,201 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pyosim.compression import compress_file, decompress_file, remove_scratch
+from pyosim.fileio import (
+    read_trc,
+    write_trc,
+    write_sto,
+    stream_trc,
+    frame_blocks,
+    StoFile,
+    TrcWriter,
+    TimeIndex,
+    count_frames,
+    probe_time_range,
+)
+
+MARKERS_TRC = Path(__file__).parent / 'data' / 'markers.trc'
+N_MARKERS, N_FRAMES, RATE = 4, 580, 100.0
+LABELS = ['boite:gauche_ext', 'boite:gauche_int', 'boite:droite_int', 'boite:droite_ext']
+
+
+def parse_trc(filename):
+    """Data lines of a trc file parsed with `float`, as (frames, time, markers with shape (3, n_markers, n_frames))"""
+    with open(filename) as file:
+        rows = np.array([[float(value) for value in line.split()] for line in file.read().splitlines()[6:]])
+    return rows[:, 0], rows[:, 1], rows[:, 2:].reshape(rows.shape[0], -1, 3).transpose(2, 1, 0)
+
+
+def data_lines(filename):
+    """Lines of a text file, without the first one (holding the file path in trc files)"""
+    with open(filename) as file:
+        return file.read().splitlines()[1:]
+
+
+def test_read_trc():
+    data, time, header = read_trc(MARKERS_TRC)
+    _, expected_time, expected = parse_trc(MARKERS_TRC)
+
+    assert data.shape == (3, N_MARKERS, N_FRAMES)
+    assert header['labels'] == LABELS
+    assert header['rate'] == RATE
+    assert header['unit'] == 'mm'
+    np.testing.assert_array_equal(header['frames'], np.arange(1, N_FRAMES + 1))
+    np.testing.assert_allclose(time, expected_time)
+    np.testing.assert_allclose(data, expected, rtol=1e-12)
+
+
+def test_write_trc_matches_adapter(tmp_path):
+    # the fixture was written by osim.TRCFileAdapter
+    _, _, data = parse_trc(MARKERS_TRC)
+    write_trc(tmp_path / 'markers.trc', data, LABELS, RATE, 'mm', decimals=None)
+    assert data_lines(tmp_path / 'markers.trc') == data_lines(MARKERS_TRC)
+
+
+def test_stream_trc_matches_write_trc(tmp_path):
+    _, _, data = parse_trc(MARKERS_TRC)
+    write_trc(tmp_path / 'bulk.trc', data, LABELS, RATE, 'mm')
+    n_frames = stream_trc(tmp_path / 'stream.trc', frame_blocks(data, chunk_size=77), LABELS, RATE, 'mm')
+    assert n_frames == N_FRAMES
+    assert count_frames(tmp_path / 'stream.trc') == N_FRAMES
+    # the frame count of a stream is patched in a padded field, the rest of the file is identical
+    assert data_lines(tmp_path / 'stream.trc')[2:] == data_lines(tmp_path / 'bulk.trc')[2:]
+
+
+def test_write_trc_unit_and_decimals(tmp_path):
+    _, _, data = parse_trc(MARKERS_TRC)
+    write_trc(tmp_path / 'markers.trc', data, LABELS, RATE, 'mm', decimals=4, output_unit='m')
+    converted, _, header = read_trc(tmp_path / 'markers.trc')
+    assert header['unit'] == 'm'
+    # 4 decimals in mm are 7 decimals in m
+    np.testing.assert_allclose(converted, np.round(converted, 7), rtol=1e-12)
+    np.testing.assert_allclose(converted, data * 1e-3, rtol=0, atol=0.5e-7 + 1e-12)
+
+
+def test_write_trc_keeps_time_and_frames(tmp_path):
+    data, time, header = read_trc(MARKERS_TRC)
+    write_trc(tmp_path / 'shifted.trc', data, LABELS, RATE, 'mm', time=time + 1, frames=header['frames'] + 100)
+    assert probe_time_range(tmp_path / 'shifted.trc') == (1.0, 6.79)
+
+    _, shifted_time, shifted_header = read_trc(tmp_path / 'shifted.trc')
+    np.testing.assert_allclose(shifted_time, time + 1)
+    np.testing.assert_array_equal(shifted_header['frames'], header['frames'] + 100)
+
+
+@pytest.mark.parametrize('names', [None, ['boite:droite_int'], ['boite:droite_ext', 'boite:gauche_ext']])
+@pytest.mark.parametrize('start,end', [(None, None), (1.0, 1.5), (None, 0.2), (5.5, None)])
+def test_read_trc_window_and_columns(names, start, end):
+    data, time, header = read_trc(MARKERS_TRC)
+    window, window_time, window_header = read_trc(MARKERS_TRC, names=names, start=start, end=end)
+
+    mask = np.ones(time.shape, dtype=bool)
+    if start is not None:
+        mask &= time >= start - 1e-9
+    if end is not None:
+        mask &= time <= end + 1e-9
+    columns = [LABELS.index(name) for name in names or LABELS]
+    assert window_header['labels'] == (names or LABELS)
+    np.testing.assert_array_equal(window_time, time[mask])
+    np.testing.assert_array_equal(window, data[:, columns, :][..., mask])
+
+
+@pytest.mark.parametrize('start,end', [(10, 11), (-5, -4)])
+def test_read_trc_empty_window(start, end):
+    data, time, header = read_trc(MARKERS_TRC, start=start, end=end)
+    assert data.shape == (3, N_MARKERS, 0)
+    assert time.size == 0
+    assert header['frames'].size == 0
+
+
+def test_write_sto_read_back(tmp_path):
+    data = np.random.RandomState(0).randn(3, 250)
+    write_sto(tmp_path / 'analogs.sto', data, ['a', 'b', 'c'], RATE, metadata={'header': 'Analogs'})
+
+    with open(tmp_path / 'analogs.sto') as file:
+        lines = file.read().splitlines()
+    assert lines[:6] == ['Analogs', 'nRows=250', 'DataType=double', 'version=3', 'endheader', 'time\ta\tb\tc']
+
+    sto = StoFile(tmp_path / 'analogs.sto')
+    time, read = sto.read()
+    np.testing.assert_allclose(time, np.arange(250) / RATE)
+    np.testing.assert_allclose(read, data, rtol=1e-12)
+    assert count_frames(tmp_path / 'analogs.sto') == 250
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+def test_sto_window_and_columns(tmp_path, use_index):
+    data = np.random.RandomState(1).randn(4, 1000)
+    filename = tmp_path / 'analogs.sto'
+    write_sto(filename, data, ['a', 'b', 'c', 'd'], RATE)
+    if use_index:
+        TimeIndex.build(filename, step=64).save()
+
+    time, read = StoFile(filename).read(names=['d', 'b'], start=2.5, end=4.0, chunk_size=100, use_index=use_index)
+    mask = (np.arange(1000) / RATE >= 2.5 - 1e-9) & (np.arange(1000) / RATE <= 4.0 + 1e-9)
+    np.testing.assert_allclose(time, np.arange(1000)[mask] / RATE)
+    np.testing.assert_allclose(read, data[[3, 1]][:, mask], rtol=1e-12)
+
+    time, read = StoFile(filename).read(start=20, end=21, use_index=use_index)
+    assert time.size == 0
+    assert read.shape == (4, 0)
+
+
+@pytest.mark.parametrize('compression', ['.gz', '.bz2', '.xz'])
+def test_compressed_trc(tmp_path, compression):
+    data, _, _ = read_trc(MARKERS_TRC)
+    write_trc(tmp_path / 'markers.trc', data, LABELS, RATE, 'mm')
+    write_trc(tmp_path / f'markers.trc{compression}', data, LABELS, RATE, 'mm')
+
+    compressed, time, _ = read_trc(tmp_path / f'markers.trc{compression}', start=1.0, end=2.0)
+    plain, plain_time, _ = read_trc(tmp_path / 'markers.trc', start=1.0, end=2.0)
+    np.testing.assert_array_equal(compressed, plain)
+    np.testing.assert_array_equal(time, plain_time)
+    assert count_frames(tmp_path / f'markers.trc{compression}') == N_FRAMES
+    assert probe_time_range(tmp_path / f'markers.trc{compression}') == (0.0, 5.79)
+
+
+def test_compress_decompress(tmp_path):
+    plain = tmp_path / 'markers.trc'
+    plain.write_bytes(MARKERS_TRC.read_bytes())
+
+    compressed = compress_file(plain)
+    assert compressed == tmp_path / 'markers.trc.gz'
+    assert not plain.exists()
+
+    scratch = decompress_file(compressed, directory=tmp_path)
+    assert scratch.read_bytes() == MARKERS_TRC.read_bytes()
+    remove_scratch(scratch)
+    assert not scratch.parent.exists()
+
+
+def test_probe_time_range(tmp_path):
+    assert probe_time_range(MARKERS_TRC) == (0.0, 5.79)
+
+    write_sto(tmp_path / 'analogs.sto', np.zeros((2, 101)), ['a', 'b'], RATE, time=np.linspace(1.0, 2.0, 101))
+    assert probe_time_range(tmp_path / 'analogs.sto') == (1.0, 2.0)
+
+
+@pytest.mark.parametrize('filename', ['markers.trc', 'markers.trc.gz'])
+@pytest.mark.parametrize('n_frames', [None, N_FRAMES])
+def test_stream_error_removes_partial_file(tmp_path, filename, n_frames):
+    _, _, data = parse_trc(MARKERS_TRC)
+
+    def blocks():
+        yield data[..., :100]
+        raise RuntimeError('acquisition stopped')
+
+    with pytest.raises(RuntimeError, match='acquisition stopped'):
+        with TrcWriter(tmp_path / filename, LABELS, RATE, 'mm', n_frames=n_frames) as writer:
+            for block in blocks():
+                writer.write(block)
+    assert not any(tmp_path.iterdir())
+
+
+def test_stream_frame_count_checked(tmp_path):
+    _, _, data = parse_trc(MARKERS_TRC)
+    with pytest.raises(ValueError, match='100 frames written'):
+        with TrcWriter(tmp_path / 'markers.trc', LABELS, RATE, 'mm', n_frames=N_FRAMES) as writer:
+            writer.write(data[..., :100])
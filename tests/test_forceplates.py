@@ -0,0 +1,71 @@
+import numpy as np
+
+from pyosim.analogs import Analogs3dOsim
+from pyosim.forceplates import calibrate, plate_kinetics, external_loads
+
+N_FRAMES = 100
+HEIGHT = -0.04
+
+
+def synthetic_loads(threshold_frames=()):
+    """Forces applied at a known point of a plate (offset from its origin) with a known free moment"""
+    random = np.random.RandomState(0)
+    forces = random.uniform(-50, 50, (3, N_FRAMES))
+    forces[2] = random.uniform(200, 800, N_FRAMES)
+    forces[2, list(threshold_frames)] = 5.0
+    cop = np.stack([random.uniform(-0.2, 0.2, N_FRAMES), random.uniform(-0.3, 0.3, N_FRAMES),
+                    np.full(N_FRAMES, HEIGHT)])
+    free_moment = random.uniform(-5, 5, N_FRAMES)
+    moments = np.cross(cop, forces, axis=0)
+    moments[2] += free_moment
+    return np.concatenate([forces, moments])[np.newaxis, ...], forces, cop, free_moment
+
+
+def test_calibrate():
+    voltages = np.random.RandomState(1).randn(2, 6, 10)
+    calibration = np.random.RandomState(2).randn(6, 6)
+    expected = np.stack([calibration @ voltages[0], calibration @ voltages[1]])
+    np.testing.assert_allclose(calibrate(voltages, calibration), expected)
+
+
+def test_plate_kinetics():
+    loads, forces, cop, free_moment = synthetic_loads()
+    plate_forces, plate_cop, plate_free_moment = plate_kinetics(loads, surface_height=HEIGHT)
+    np.testing.assert_allclose(plate_forces[0], forces)
+    np.testing.assert_allclose(plate_cop[0], cop, atol=1e-12)
+    np.testing.assert_allclose(plate_free_moment[0], free_moment, atol=1e-10)
+
+
+def test_plate_kinetics_threshold():
+    unloaded = [0, 10, 99]
+    loads, forces, cop, free_moment = synthetic_loads(threshold_frames=unloaded)
+    plate_forces, plate_cop, plate_free_moment = plate_kinetics(loads, surface_height=HEIGHT, threshold=20.0)
+
+    loaded = np.ones(N_FRAMES, dtype=bool)
+    loaded[unloaded] = False
+    assert not plate_forces[..., ~loaded].any()
+    assert not plate_cop[..., ~loaded].any()
+    assert not plate_free_moment[..., ~loaded].any()
+    np.testing.assert_allclose(plate_cop[0][:, loaded], cop[:, loaded], atol=1e-12)
+    np.testing.assert_allclose(plate_free_moment[0][loaded], free_moment[loaded], atol=1e-10)
+
+
+def test_external_loads_in_global_frame():
+    loads, forces, cop, free_moment = synthetic_loads()
+    analogs = Analogs3dOsim(loads)
+    analogs.get_rate = 1000.0
+    analogs.get_labels = [f'Voltage.{i}' for i in range(1, 7)]
+    rotation = np.array([[1, 0, 0], [0, 0, 1], [0, -1, 0]])
+    position = np.array([0.5, 0.0, -0.25])
+
+    external = external_loads(analogs, channels=[analogs.get_labels], calibration=np.eye(6), rotation=rotation,
+                              position=position, surface_height=HEIGHT, reaction=False)
+    labels = list(external.get_labels)
+    assert labels[:3] == ['1_ground_force_vx', '1_ground_force_vy', '1_ground_force_vz']
+    assert external.get_rate == 1000.0
+
+    columns = np.asarray(external[0, ...])
+    np.testing.assert_allclose(columns[0:3], rotation @ forces)
+    np.testing.assert_allclose(columns[3:6], rotation @ cop + position[:, np.newaxis], atol=1e-12)
+    # the free moment is about the plate normal, the global y axis here
+    np.testing.assert_allclose(columns[6:9], np.outer(rotation[:, 2], free_moment), atol=1e-10)
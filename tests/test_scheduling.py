@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+
+from pyosim.fileio import write_sto
+from pyosim.model import get_muscle_count
+from pyosim.scheduling import CostModel
+
+MODEL = """<OpenSimDocument Version="30000">
+    <Model name="test">
+        <ForceSet>
+            <objects>
+{}
+            </objects>
+        </ForceSet>
+    </Model>
+</OpenSimDocument>
+"""
+
+
+def write_model(filename, n_muscles):
+    filename.write_text(MODEL.format('\n'.join(f'<Thelen2003Muscle name="m{i}"/>' for i in range(n_muscles))))
+
+
+def write_trials(directory, n_frames):
+    files = []
+    for i, n in enumerate(n_frames):
+        files.append(directory / f'trial{i}.mot')
+        write_sto(files[-1], np.zeros((2, n)), ['a', 'b'], 100.0)
+    return files
+
+
+def test_work(tmp_path):
+    model = tmp_path / 'model.osim'
+    write_model(model, 3)
+    trial, = write_trials(tmp_path, [50])
+
+    assert CostModel.work(trial, 'InverseKinematics', model) == 50
+    assert CostModel.work(trial, 'StaticOptimization', model) == 50 * 4
+    assert CostModel.work(tmp_path / 'missing.mot', 'InverseKinematics') == 1
+
+
+def test_muscle_count_follows_model_edits(tmp_path):
+    model = tmp_path / 'model.osim'
+    write_model(model, 3)
+    assert get_muscle_count(model) == 3
+
+    write_model(model, 5)
+    stat = model.stat()
+    os.utime(model, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert get_muscle_count(model) == 5
+
+
+def test_longest_first_without_history(tmp_path):
+    files = write_trials(tmp_path, [100, 300, 200])
+    assert CostModel().longest_first(files, 'InverseKinematics') == [files[1], files[2], files[0]]
+
+
+def test_longest_first_with_history(tmp_path):
+    files = write_trials(tmp_path, [100, 300, 200])
+    history = tmp_path / '_run_times.json'
+
+    cost_model = CostModel(history=history)
+    # the shortest trial took the longest (e.g. a hard to fit trial)
+    for ifile, seconds in zip(files, [9.0, 3.0, 2.0]):
+        cost_model.record(ifile, 'InverseKinematics', seconds)
+    cost_model.save()
+
+    reloaded = CostModel(history=history)
+    assert reloaded.longest_first(files, 'InverseKinematics') == [files[0], files[1], files[2]]
+    assert reloaded.estimate(files[0], 'InverseKinematics') == 9.0
+    # the other stages are still sorted by work
+    assert reloaded.longest_first(files, 'InverseDynamics') == [files[1], files[2], files[0]]
+
+
+def test_fit(tmp_path):
+    files = write_trials(tmp_path, [100, 200, 300, 400])
+    cost_model = CostModel()
+    assert cost_model.fit('InverseKinematics') == (0.0, 1.0)
+
+    for ifile, seconds in zip(files, [3.0, 5.0, 7.0, 9.0]):
+        cost_model.record(ifile, 'InverseKinematics', seconds)
+    intercept, slope = cost_model.fit('InverseKinematics')
+    np.testing.assert_allclose([intercept, slope], [1.0, 0.02])
+
+    (tmp_path / 'new').mkdir()
+    new_trial, = write_trials(tmp_path / 'new', [500])
+    np.testing.assert_allclose(cost_model.estimate(new_trial, 'InverseKinematics'), 11.0)